@@ -1,35 +1,112 @@
-import aiohttp
+import argparse
 import asyncio
+import atexit
 import logging
 import os
+import queue
 import re
+import signal
+import time
 from datetime import datetime, timezone
-from time import sleep
+from logging.handlers import QueueHandler, QueueListener
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+from api_decode import Page, decode_entities, project, query_pages
+from checkpoint import Checkpoint
+from http_client import HttpClient
+from metrics import Metrics
+from offline_dump import run_offline
+from page_state import PageState
+from proposals import ProposalWriter, apply_proposals
+from rate_limiter import EDIT_RATE, RateController
+from run_log import RunLog
+from shards import (PARTITIONS_PER_WORKER, LeaseStore, merge_shards, parse_shard, shard_of, shard_path,
+                    write_shard_report)
+from wiki_log import WikiLogPublisher
+from title_resolver import TitleResolver
+from transform_pool import TransformPool
+from wikidata_cache import CACHE_PATH, EntityCache
+from wikidata_time import format_time
+from wikitext import normalize_name, scan_templates
 
 API_URL = "https://www.hamichlol.org.il/w/api.php"
 USERNAME = os.getenv('BOT_USERNAME')
 PASSWORD = os.getenv('BOT_PASSWORD')
 CATEGORY = "שגיאות פרמטריות בתבנית אתר רשמי" 
+DATE_TEMPLATE = "תאריך משולב"
+WIKIDATA_API_URL = "https://www.wikidata.org/w/api.php"
+HEWIKI_API_URL = "https://he.wikipedia.org/w/api.php"
+WIKIDATA_BATCH_SIZE = 50
+QUEUE_SIZE = 20
+CONTENT_WORKERS = 4
+ENTITY_WORKERS = 4
+TRANSFORM_WORKERS = 2
+CHECKPOINT_INTERVAL = 50
+RECENT_CHANGES_MAX_AGE = 30 * 24 * 3600
+
+# (list module, parameter prefix, title) of every listing that feeds the run
+CATEGORY_SOURCE = ('categorymembers', 'cm', f'קטגוריה:{CATEGORY}')
+DATE_TEMPLATE_SOURCE = ('embeddedin', 'ei', f'תבנית:{DATE_TEMPLATE}')
+# Only pages with a bare or blank-only call, found by search; falls back to embeddedin
+DATE_TEMPLATE_SEARCH_SOURCE = ('search', 'sr', f'תבנית:{DATE_TEMPLATE}')
+PAGE_SOURCES = [CATEGORY_SOURCE, DATE_TEMPLATE_SOURCE]
 
 class WikidataBot:
-    def __init__(self):
-        self.session = None
+    api_url = API_URL
+    wikidata_api_url = WIKIDATA_API_URL
+    hewiki_api_url = HEWIKI_API_URL
+    bot_log = 'bot.log'
+    log_path = "log.txt"
+    wiki_log_page = "משתמש:נריה_בוט/log-wikidata"
+    log_interval = 200
+    cache_path = CACHE_PATH
+    checkpoint_path = "checkpoint.sqlite"
+    proposals_path = 'proposals.jsonl'
+    metrics_path = 'metrics.prom'
+    shard_report_path = 'shard_report.json'
+    edit_summary = 'שאיבת פרמטרי תבנית מוויקינתונים'
+    page_sources = PAGE_SOURCES
+
+    def __init__(self, resume=False, deadline=None, incremental=False, dry_run=None, shard=None, leases=None):
+        # Shards keep their own checkpoint, logs and metrics and share the edit budget; caches are shared
+        self.shard = shard
+        if shard:
+            for name in ('log_path', 'checkpoint_path', 'metrics_path', 'shard_report_path'):
+                setattr(self, name, shard_path(getattr(self, name), *shard))
+        if dry_run:
+            # A dry run must neither reset nor resume the checkpoint of an interrupted real run
+            stem, extension = os.path.splitext(self.checkpoint_path)
+            self.checkpoint_path = f"{stem}.dry-run{extension}"
+        self.leases = (LeaseStore(leases, shard[1] * PARTITIONS_PER_WORKER, f"{shard[0]}/{shard[1]}")
+                       if leases else None)
+        # (index, count) of the titles this process lists; with leases, set per claimed partition
+        self.partition = None if leases else shard
+        self.http = HttpClient()
         self.edit_token = None
-        self.num_requests = 0
-        self.log_path = "log.txt"
-        self.wiki_log_page = "משתמש:נריה_בוט/log-wikidata"
+        self.metrics = Metrics()
+        self.rate = RateController(edit_rate=EDIT_RATE / shard[1] if shard else EDIT_RATE, metrics=self.metrics)
         self.processed_count = 0
-        self.edited_pages = []
-        self.error_pages = []
+        self.run_log = RunLog(self.log_path)
+        self.wiki_log = WikiLogPublisher(self, self.wiki_log_page, self.log_interval)
+        self.cache = EntityCache(self.cache_path)
+        self.queue_size = QUEUE_SIZE
+        self.content_workers = CONTENT_WORKERS
+        self.entity_workers = ENTITY_WORKERS
+        self.transform_workers = TRANSFORM_WORKERS
+        self.transform_pool = TransformPool(self)
+        self.checkpoint = Checkpoint(self.checkpoint_path)
+        self.resume = resume
+        self.deadline_minutes = deadline
+        self.deadline = None
+        self.stop_requested = False
+        self.incomplete = False
+        self.incremental = incremental
+        self.dry_run = dry_run
+        self.proposals = None
+        self.resolver = TitleResolver()
+        self.cirrus_search = None
+        self.page_state = PageState(self.cache_path)
+        # Claim values whose datatype needs more than the raw value, e.g. Wikidata dates
+        self.value_handlers = {'time': format_time}
         
         self.templates = [ ## Customer from https://www.hamichlol.org.il/משתמש:מקוה/ויקינתונים.js
             {
@@ -244,40 +321,60 @@ class WikidataBot:
                 "regex": r"\{\{אנצ יהודית\}\}",
                 "parameters": [{"claim": "P8590", "param": "", "text": ""}]
             },
+            {
+                "name": DATE_TEMPLATE,
+                "regex": r"\{\{תאריך משולב\}\}",
+                "parameters": [
+                    {"claim": "P569", "param": "תאריך לידה", "text": ""},
+                    {"claim": "P570", "param": "תאריך פטירה", "text": ""}
+                ]
+            },
         ]
+        self.templates_regex = self.compile_templates()
+        self.properties = self.required_properties()
 
-    async def open_session(self):
-        if self.session is None:
-            self.session = aiohttp.ClientSession()
+    def required_properties(self):
+        return sorted({param['claim'] for template in self.templates
+                       for param in template['parameters'] if param['claim']})
+
+    def project_entity(self, entity):
+        return project(entity, self.properties)
+
+    def compile_templates(self):
+        # One alternation over the whole registry; group t<i> marks self.templates[i]
+        pattern = '|'.join(f"(?P<t{i}>{template['regex']})" for i, template in enumerate(self.templates))
+        self.template_names = {}
+        return re.compile(pattern, re.IGNORECASE)
+
+    def template_for(self, name):
+        """Registry entry for a scanned template name, or None
+
+        Entries are recognized by their regex matching the bare invocation,
+        so aliases such as Findagrave keep working; answers are kept per name.
+        """
+        if name not in self.template_names:
+            match = self.templates_regex.fullmatch(f"{{{{{name}}}}}")
+            self.template_names[name] = self.templates[int(match.lastgroup[1:])] if match else None
+        return self.template_names[name]
 
     async def close_session(self):
-        if self.session:
-            await self.session.close()
-            self.session = None
+        await self.http.close()
 
     async def __aenter__(self):
-        await self.open_session()
         return self
 
     async def __aexit__(self, exc_type, exc_value, traceback):
         await self.close_session()
 
-    async def wiki_request(self, method: str, data: dict, token=None):
-        self.num_requests += 1
-        await self.open_session()
+    async def wiki_request(self, method: str, data: dict, token=None, kind='read', resend=True):
         data['format'] = 'json'
         if token is not None:
             data['token'] = token
 
-        try:
-            async with self.session.request(method, API_URL, 
-                                          params=data if method == 'get' else None, 
-                                          data=data if method == 'post' else None) as response:
-                response.raise_for_status()
-                return await response.json()
-        except Exception as e:
-            logging.error(f"Error in wiki_request: {str(e)}")
-            return None
+        response = await self.rate.request(self.http, method, self.api_url, data, kind, resend=resend)
+        if response and 'error' in response:
+            logging.error(f"API error {response['error'].get('code')}: {response['error'].get('info')}")
+        return response
 
     async def get_token(self, token_type="csrf"):
         params = {
@@ -313,113 +410,398 @@ class WikidataBot:
         logging.error("Login failed")
         return False
 
-    async def get_category_members(self):
-        continue_param = {}
+    def search_query(self, title):
+        """CirrusSearch query for pages with a call to a registry template that has no value set"""
+        name = normalize_name(title)
+        names = '|'.join(param['param'] for param in self.template_for(name)['parameters'] if param['param'])
+        blank = f'( *\\|( *({names}) *=)?)*' if names else '( *\\|)*'
+        return f'hastemplate:"{name}" insource:/\\{{\\{{ *{name.replace(" ", "[ _]")}{blank} *\\}}\\}}/'
+
+    async def search_supported(self):
+        """Whether the wiki runs CirrusSearch; the default backend accepts insource: but ignores it"""
+        if self.cirrus_search is None:
+            response = await self.wiki_request('get', {'action': 'query', 'meta': 'siteinfo', 'siprop': 'extensions'})
+            if not response or 'query' not in response:
+                return False
+            self.cirrus_search = any(extension.get('name') == 'CirrusSearch'
+                                     for extension in response['query'].get('extensions', []))
+        return self.cirrus_search
+
+    async def get_source_titles(self, index, continue_param=None):
+        list_name, prefix, title = self.page_sources[index]
+        continue_param = dict(continue_param or {})
+        fallback = continue_param.pop('fallback', False)
+        if fallback:
+            list_name, prefix = 'embeddedin', 'ei'
+        # Filled pages drop out of the search results and shift sroffset under a paged
+        # listing, so every result is read before any is yielded; a resumed run searches
+        # again from the start and skips the completed titles
+        searching = list_name == 'search'
+        if searching:
+            continue_param = {}
+            if not await self.search_supported():
+                logging.warning(f"The wiki has no CirrusSearch, listing every page that embeds {title}")
+                async for page in self.get_source_titles(index, {'fallback': True}):
+                    yield page
+                return
+        found = []
         while True:
-            try:
+            params = {
+                'action': 'query',
+                'list': list_name,
+                f'{prefix}limit': '500',
+                f'{prefix}namespace': '0',
+                'format': 'json'
+            }
+            if searching:
+                params.update({'srsearch': self.search_query(title), 'srwhat': 'text', 'srinfo': '', 'srprop': ''})
+            else:
+                params[f'{prefix}title'] = title
+            params.update(continue_param)
+            token = dict({} if searching else continue_param, source=index,
+                         **({'fallback': True} if fallback else {}))
+            self.checkpoint.listing_advanced(token)
+            
+            response = await self.wiki_request('get', params)
+            # A regex search that times out answers with partial results and a warning
+            warning = (response or {}).get('warnings', {}).get('search')
+            if searching and (not response or 'query' not in response or warning):
+                reason = warning.get('*', warning) if warning else 'no answer'
+                logging.warning(f"Search is unavailable ({reason}), listing every page that embeds {title}")
+                async for page in self.get_source_titles(index, {'fallback': True}):
+                    yield page
+                return
+            if not response or 'query' not in response:
+                self.request_failed(f"Listing {title}")
+                break
+            
+            for page in response['query'][list_name]:
+                if searching:
+                    found.append(Page(page['title'], continue_param=token))
+                else:
+                    yield Page(page['title'], continue_param=token)
+            
+            if 'continue' not in response:
+                break
+            continue_param = response['continue']
+
+        for page in found:
+            yield page
+
+    async def get_page_titles(self, continue_param=None):
+        # Sources are chained in order; the saved token names the source it belongs to
+        continue_param = dict(continue_param or {})
+        start = continue_param.pop('source', 0)
+        seen = set()
+        for index in range(start, len(self.page_sources)):
+            async for page in self.get_source_titles(index, continue_param if index == start else None):
+                if self.partition and shard_of(page.title, self.partition[1]) != self.partition[0]:
+                    continue
+                if page.title not in seen:
+                    seen.add(page.title)
+                    yield page
+
+    def source_transcludes(self, index):
+        """Whether every page of a source is known to use a registry template"""
+        list_name, _, title = self.page_sources[index]
+        return list_name in ('embeddedin', 'search') and self.template_for(normalize_name(title)) is not None
+
+    async def prefilter(self, pages):
+        """Titles of the listed pages that transclude a registry template
+
+        Pages from an embeddedin source of a registry template pass as they
+        are; the rest are checked with prop=templates, WIKIDATA_BATCH_SIZE
+        titles a request. If the check fails the pages are kept.
+        """
+        kept, unknown = [], []
+        for page in pages:
+            (kept if self.source_transcludes(page.continue_param['source']) else unknown).append(page.title)
+        self.metrics.inc('prefilter_total', len(kept), result='kept')
+        template_titles = '|'.join(f"תבנית:{template['name']}" for template in self.templates)
+        for start in range(0, len(unknown), WIKIDATA_BATCH_SIZE):
+            titles = unknown[start:start + WIKIDATA_BATCH_SIZE]
+            transcluding = set()
+            continue_param = {}
+            while True:
                 params = {
                     'action': 'query',
-                    'list': 'categorymembers',
-                    'cmtitle': f'קטגוריה:{CATEGORY}',
-                    'cmlimit': '500',
-                    'cmnamespace': '0',
+                    'titles': '|'.join(titles),
+                    'prop': 'templates',
+                    'tltemplates': template_titles,
+                    'tllimit': 'max',
                     'format': 'json'
                 }
                 params.update(continue_param)
                 
-                response = await self.wiki_request('get', params)
+                response = await self.wiki_request('post', params)
                 if not response or 'query' not in response:
+                    transcluding = set(titles)
+                    self.metrics.inc('prefilter_total', len(titles), result='unchecked')
                     break
-                    
-                for page in response['query']['categorymembers']:
-                    yield page
+                
+                transcluding.update(page['title'] for page in response['query'].get('pages', {}).values()
+                                    if page.get('templates'))
                 
                 if 'continue' not in response:
+                    self.metrics.inc('prefilter_total', len(transcluding), result='kept')
+                    self.metrics.inc('prefilter_total', len(titles) - len(transcluding), result='dropped')
                     break
                 continue_param = response['continue']
-                
-                await asyncio.sleep(1)
-                
-            except Exception as e:
-                logging.error(f"Error fetching category members: {str(e)}")
+            kept.extend(title for title in titles if title in transcluding)
+        return kept
+
+    async def get_pages_content(self, titles):
+        """Pages with content and revision metadata; None if the wiki did not answer"""
+        pages = []
+        continue_param = {}
+        while titles:
+            params = {
+                'action': 'query',
+                'titles': '|'.join(titles),
+                'prop': 'revisions',
+                'rvprop': 'content|timestamp|ids',
+                'format': 'json'
+            }
+            params.update(continue_param)
+            
+            response = await self.wiki_request('post', params)
+            if not response or 'query' not in response:
+                return None
+            
+            pages.extend(query_pages(response))
+            
+            if 'continue' not in response:
                 break
+            continue_param = response['continue']
+        return pages
+
+    async def get_recent_changes(self, since):
+        titles = set()
+        continue_param = {}
+        while True:
+            params = {
+                'action': 'query',
+                'list': 'recentchanges',
+                'rcend': since,
+                'rcnamespace': '0',
+                'rctype': 'edit|new|log',
+                'rcprop': 'title',
+                'rclimit': '500',
+                'format': 'json'
+            }
+            params.update(continue_param)
+            
+            response = await self.wiki_request('get', params)
+            if not response or 'query' not in response:
+                return None
+            
+            titles.update(change['title'] for change in response['query']['recentchanges'])
+            
+            if 'continue' not in response:
+                return titles
+            continue_param = response['continue']
+
+    async def get_incremental_titles(self, continue_param=None):
+        since = self.page_state.last_run()
+        changed = None
+        if since:
+            last_run = datetime.strptime(since, '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc)
+            if (datetime.now(timezone.utc) - last_run).total_seconds() < RECENT_CHANGES_MAX_AGE:
+                changed = await self.get_recent_changes(since)
+        
+        if changed is None:
+            logging.info("No usable recent changes window, processing every listed page")
+            async for page in self.get_page_titles(continue_param):
+                yield page
+            return
+        
+        logging.info(f"Incremental run: {len(changed)} pages changed on the wiki since {since}")
+        async for batch in self.batch_pages(self.get_page_titles(continue_param)):
+            titles = [page.title for page in batch]
+            known = self.page_state.get(titles)
+            todo = {title for title in titles if title not in known or title in changed}
+            
+            # Unchanged on the wiki: reprocess only if the linked item has a new revision
+            unchanged = [title for title in titles if title not in todo]
+            if unchanged:
+                qids = await self.resolve_titles(unchanged) or {}
+                wanted = sorted({qid for qid in qids.values() if qid})
+                current = await self.fetch_wikidata_entities(wanted, 'info') if wanted else {}
+                failed = not qids or current is None
+                current = current or {}
+                for title in unchanged:
+                    entity = current.get(qids.get(title))
+                    if failed or (entity and entity.lastrevid) != known[title][1]:
+                        todo.add(title)
+                        if qids.get(title):
+                            self.cache.invalidate([qids[title]])
+            
+            for page in batch:
+                if page.title in todo:
+                    yield page
+
+    def wikidata_title(self, title):
+        return self.resolver.apply_rules(title)
+
+    def normalize_title(self, title):
+        title = ' '.join(title.replace('_', ' ').split())
+        return title[:1].upper() + title[1:]
+
+    async def batch_pages(self, pages, size=WIKIDATA_BATCH_SIZE):
+        batch = []
+        async for page in pages:
+            batch.append(page)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    async def get_wikidata_claims(self, titles):
+        """Title -> entity, None for pages without an item; None if a lookup failed"""
+        qids = await self.resolve_titles(titles)
+        if qids is None:
+            return None
+        entities = await self.get_entities(sorted({qid for qid in qids.values() if qid}))
+        if entities is None:
+            return None
+        return {title: entities.get(qid) for title, qid in qids.items()}
+
+    async def resolve_titles(self, titles):
+        """Title -> QID or None; None if a hewiki lookup failed"""
+        lookup = {title: self.wikidata_title(title) for title in titles}
+        known, unknown = self.resolver.lookup(set(lookup.values()))
+        self.metrics.inc('title_cache_total', len(known), result='hit')
+        self.metrics.inc('title_cache_total', len(unknown), result='miss')
+
+        for start in range(0, len(unknown), WIKIDATA_BATCH_SIZE):
+            resolved = await self.fetch_wikibase_items(unknown[start:start + WIKIDATA_BATCH_SIZE])
+            if resolved is None:
+                return None
+            self.resolver.store(resolved)
+            known.update(resolved)
+
+        return {title: known[lookup[title]] for title in titles if lookup[title] in known}
 
-    async def get_wikidata_claims(self, title):
+    async def fetch_wikibase_items(self, titles):
         params = {
-            'action': 'wbgetentities',
-            'sites': 'hewiki',
-            'titles': title,
-            'props': 'claims|labels|descriptions',
-            'languages': 'he',
+            'action': 'query',
+            'prop': 'pageprops',
+            'ppprop': 'wikibase_item',
+            'redirects': '1',
+            'titles': '|'.join(titles),
             'format': 'json'
         }
         
-        for attempt in range(3):
-            try:
-                async with self.session.get('https://www.wikidata.org/w/api.php', 
-                                          params=params, ssl=False) as response:
-                    if response.status == 200:
-                        return await response.json()
-                    
-            except Exception as e:
-                logging.error(f"Wikidata attempt {attempt + 1} failed: {str(e)}")
-                if attempt < 2:
-                    await asyncio.sleep(2 ** attempt)
-                continue
-                
-        logging.error(f"Failed to fetch Wikidata claims for {title} after 3 attempts")
-        return {}
+        response = await self.rate.request(self.http, 'post', self.hewiki_api_url, params)
+        if not response or 'query' not in response:
+            logging.error(f"Failed to resolve {len(titles)} titles on hewiki")
+            return None
+        return self.map_wikibase_items(titles, response)
+
+    def map_wikibase_items(self, titles, response):
+        if not response or 'query' not in response:
+            return {}
 
-    async def get_page_content(self, title):
+        query = response['query']
+        normalized = {item['from']: item['to'] for item in query.get('normalized', [])}
+        redirects = {item['from']: item['to'] for item in query.get('redirects', [])}
+        items = {page['title']: page.get('pageprops', {}).get('wikibase_item')
+                 for page in query.get('pages', {}).values()}
+
+        resolved = {}
+        for title in titles:
+            target = normalized.get(title, title)
+            target = redirects.get(target, target)
+            resolved[title] = items.get(target)
+        return resolved
+
+    async def get_entities(self, qids):
+        """QID -> entity for the items that exist, from the cache where fresh; None if a fetch failed"""
+        hits, stale, misses = self.cache.lookup(qids, self.properties)
+        self.metrics.inc('entity_cache_total', len(hits), result='hit')
+        self.metrics.inc('entity_cache_total', len(misses), result='miss')
+
+        if stale:
+            # Cheap lastrevid check; only entities that changed are refetched in full
+            current = await self.fetch_wikidata_entities(list(stale), 'info')
+            if current is None:
+                return None
+            unchanged = [qid for qid, lastrevid in stale.items()
+                         if current.get(qid) and current[qid].lastrevid == lastrevid]
+            self.cache.touch(unchanged)
+            self.metrics.inc('entity_cache_total', len(unchanged), result='revalidated')
+            self.metrics.inc('entity_cache_total', len(stale) - len(unchanged), result='stale')
+            hits.update({qid: self.cache.get(qid) for qid in unchanged})
+            misses.extend(qid for qid in stale if qid not in unchanged)
+
+        if misses:
+            fetched = await self.fetch_wikidata_entities(misses, 'info|claims')
+            if fetched is None:
+                return None
+            self.cache.store(fetched)
+            hits.update(fetched)
+
+        return hits
+
+    async def fetch_wikidata_entities(self, qids, props):
         params = {
-            'action': 'query',
-            'prop': 'revisions',
-            'titles': title,
-            'rvprop': 'content',
+            'action': 'wbgetentities',
+            'ids': '|'.join(qids),
+            'props': props,
             'format': 'json'
         }
         
-        try:
-            response = await self.wiki_request('get', params)
-            if not response or 'query' not in response:
-                return ""
-                
-            page = next(iter(response['query']['pages'].values()))
-            if 'revisions' not in page:
-                return ""
-                
-            return page['revisions'][0]['*']
-            
-        except Exception as e:
-            logging.error(f"Error getting page content: {str(e)}")
-            return ""
+        response = await self.rate.request(self.http, 'post', self.wikidata_api_url, params, 'wikidata',
+                                           decode=lambda body: decode_entities(body, self.properties))
+        if response is None:
+            logging.error(f"Failed to fetch Wikidata claims for {len(qids)} entities")
+        return self.map_entities(response)
 
-    async def save_page(self, title, text, summary):
+    def map_entities(self, response):
+        if response and 'error' in response:
+            logging.error(f"Wikidata error: {response['error'].get('info', response['error'])}")
+            return None
+        return response['entities'] if response else None
+
+    async def save_page(self, title, text, summary, baserevid=None, basetimestamp=None, append=False):
         if not self.edit_token:
             self.edit_token = await self.get_token()
 
         data = {
             'action': 'edit',
             'title': title,
-            'text': text,
+            'appendtext' if append else 'text': text,
             'summary': summary,
             'token': self.edit_token,
             'bot': '1'
         }
+        if baserevid:
+            data['baserevid'] = baserevid
+        if basetimestamp:
+            data['basetimestamp'] = basetimestamp
         
         try:
-            response = await self.wiki_request('post', data)
-            return response and 'error' not in response
+            # An append that timed out may already be on the page; sending it again would repeat it
+            response = await self.wiki_request('post', data, kind='edit', resend=not append)
+            if response and response.get('error', {}).get('code') == 'badtoken':
+                self.edit_token = await self.get_token()
+                data['token'] = self.edit_token
+                response = await self.wiki_request('post', data, kind='edit', resend=not append)
+            return bool(response) and 'error' not in response
         except Exception as e:
             logging.error(f"Error saving page {title}: {str(e)}")
             return False
 
     def get_claim_value(self, claim, parameter):
         try:
-            if 'datavalue' not in claim['mainsnak']:
+            if claim.value is None:
                 return None
                 
-            value = claim['mainsnak']['datavalue'].get('value', '')
+            value = claim.value
+            handler = self.value_handlers.get(claim.datatype)
+            if handler:
+                return handler(value)
             if isinstance(value, str):
                 # Add Category: prefix if it's missing and parameter requests it
                 if parameter.get('text') == 'Category:' and not value.startswith('Category:'):
@@ -435,128 +817,382 @@ class WikidataBot:
             logging.error(f"Error extracting claim value: {str(e)}")
             return None
 
-    def process_template(self, text, wikidata_data, template):
-        if not wikidata_data or 'claims' not in wikidata_data:
-            return text
-            
-        claims = wikidata_data['claims']
-        parameters = []
-        
+    def template_values(self, wikidata_data, template):
+        """Argument name -> rendered claim for every parameter the item can fill"""
+        claims = wikidata_data.claims
+        values = {}
         for param in template['parameters']:
-            if not param['claim']:
+            if not param['claim'] or param['claim'] not in claims:
                 continue
-                
-            if param['claim'] in claims:
-                claim_value = self.get_claim_value(claims[param['claim']][0], param)
-                if claim_value:
-                    param_text = (f"|{param['param']}={claim_value}" if param['param'] 
-                                else f"|{claim_value}")
-                    parameters.append(param_text)
-        
-        if parameters:
-            new_template = f"{{{{{template['name']}{''.join(parameters)}}}}}"
-            return re.sub(template['regex'], new_template, text, flags=re.IGNORECASE)
-        
-        return text
+            claim_value = self.get_claim_value(claims[param['claim']], param)
+            if claim_value:
+                values[param['param'] or '1'] = claim_value
+        return values
 
-    async def process_page(self, title, content):
+    def process_page(self, title, content, entity_data, changes=None):
         try:
-            title_for_wikidata = title.replace('הרב ', '').replace('רבי ', '')
-            
-            wikidata_data = await self.get_wikidata_claims(title_for_wikidata)
-            if not wikidata_data or 'entities' not in wikidata_data:
+            if not entity_data or not entity_data.claims:
                 return content
-                
-            entity_data = next(iter(wikidata_data['entities'].values()))
             
-            new_text = content
-            for template in self.templates:
-                if re.search(template['regex'], new_text, re.IGNORECASE):
-                    new_text = self.process_template(new_text, entity_data, template)
+            values = {}
+            parts = []
+            position = 0
+            for invocation in scan_templates(content):
+                template = self.template_for(invocation.name)
+                # Calls nested in one that was just filled wait for the next run
+                if not template or invocation.start < position:
+                    continue
+                if template['name'] not in values:
+                    values[template['name']] = self.template_values(entity_data, template)
+                if not values[template['name']]:
+                    continue
+                new_template = invocation.fill(content, values[template['name']])
+                if new_template:
+                    if changes is not None:
+                        changes.append((template['name'], invocation.start,
+                                        content[invocation.start:invocation.end], new_template))
+                    parts.append(content[position:invocation.start])
+                    parts.append(new_template)
+                    position = invocation.end
+            parts.append(content[position:])
             
-            return new_text
+            return ''.join(parts)
             
         except Exception as e:
             logging.error(f"Error processing page {title}: {str(e)}")
             return content
 
     def log_progress(self, message, is_error=False):
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        log_entry = f"{timestamp}: {message}\n"
-        
         if is_error:
             logging.error(message)
-            self.error_pages.append(message)
+            self.run_log.record(message, 'error')
         else:
             logging.info(message)
-            if "נערך הדף" in message:
-                self.edited_pages.append(message)
-        
-        try:
-            with open(self.log_path, 'a', encoding='utf-8') as f:
-                f.write(log_entry)
-        except Exception as e:
-            logging.error(f"Error writing to local log: {str(e)}")
+            self.run_log.record(message, 'edit' if "נערך הדף" in message else None)
 
     async def update_wiki_log(self):
-        try:
-            log_content = "== עריכות אחרונות ==\n"
-            log_content += "\n".join(self.edited_pages[-200:])
-            log_content += "\n\n== שגיאות אחרונות ==\n"
-            log_content += "\n".join(self.error_pages[-200:])
-            
-            success = await self.save_page(
-                self.wiki_log_page, 
-                log_content,
-                f"עדכון לוג אוטומטי - {len(self.edited_pages)} עריכות, {len(self.error_pages)} שגיאות"
-            )
-            if success:
-                logging.info(f"Updated wiki log at {self.processed_count} pages")
-        except Exception as e:
-            logging.error(f"Error updating wiki log: {str(e)}")
+        """Publish waiting log entries now; during a run the background publisher does this"""
+        if self.dry_run:
+            return
+        await self.wiki_log.publish()
+
+    async def run_stage(self, workers, stage, in_queue, out_queue, out_workers):
+        await asyncio.gather(*(stage(in_queue, out_queue) for _ in range(workers)))
+        for _ in range(out_workers):
+            await out_queue.put(None)
+
+    def request_failed(self, what):
+        """Note pages lost to a request that failed for good; the run then ends like a stopped one"""
+        logging.error(f"{what} failed, the run will end early and keep its checkpoint")
+        self.incomplete = True
+
+    def request_stop(self):
+        logging.info("Stop requested, draining in-flight work")
+        self.stop_requested = True
+
+    def stopping(self):
+        if self.deadline and time.time() >= self.deadline:
+            self.stop_requested = True
+        return self.stop_requested
+
+    def page_done(self, page, outcome):
+        self.checkpoint.page_done(page.title, outcome, page.revid)
+        self.metrics.inc('pages_total', outcome=outcome)
+
+    def write_metrics(self):
+        for (host, kind), bucket in self.rate.buckets.items():
+            self.metrics.set('rate_limit_per_second', round(bucket.rate, 3), host=host, kind=kind)
+        self.metrics.write(self.metrics_path)
+
+    async def enumerate_pages(self, in_queue, out_queue):
+        continue_param, completed = None, set()
+        if self.resume:
+            continue_param, completed = self.checkpoint.load()
+            logging.info(f"Resuming with {len(completed)} completed pages")
+        else:
+            self.checkpoint.reset()
+
+        source = (self.get_incremental_titles(continue_param) if self.incremental
+                  else self.get_page_titles(continue_param))
+        pages = (page async for page in source if page.title not in completed)
+        listed = time.perf_counter()
+        async for batch in self.batch_pages(pages):
+            self.metrics.observe('stage_seconds', time.perf_counter() - listed, stage='listing')
+            for page in batch:
+                self.checkpoint.page_started(page.title, page.continue_param)
+            if self.stopping():
+                break
+            await out_queue.put(batch)
+            listed = time.perf_counter()
+
+    async def fetch_contents(self, in_queue, out_queue):
+        # Listed titles that pass the template prefilter get their wikitext and revision
+        while (batch := await in_queue.get()) is not None:
+            if self.stopping():
+                continue
+            with self.metrics.timer('stage_seconds', stage='content'):
+                kept = set(await self.prefilter(batch))
+                pages = await self.get_pages_content([page.title for page in batch if page.title in kept])
+            listed = {page.title: page for page in batch}
+            for page in batch:
+                if page.title not in kept:
+                    self.page_done(page, 'filtered')
+            if pages is None:
+                # The kept pages stay unfinished in the checkpoint for --resume
+                self.request_failed(f"Fetching the content of {len(kept)} pages")
+                continue
+            for page in pages:
+                if page.title in listed:
+                    page.continue_param = listed[page.title].continue_param
+            if pages:
+                await out_queue.put(pages)
+
+    async def fetch_entities(self, in_queue, out_queue):
+        while (batch := await in_queue.get()) is not None:
+            if self.stopping():
+                continue
+            try:
+                with self.metrics.timer('stage_seconds', stage='entities'):
+                    entities = await self.get_wikidata_claims([page.title for page in batch])
+            except Exception as e:
+                self.log_progress(f"שגיאה בשליפה מוויקינתונים: {str(e)}", is_error=True)
+                entities = None
+
+            if entities is None:
+                # Not the same as pages without an item: they stay open for --resume and the next run
+                self.request_failed(f"Looking up {len(batch)} pages on Wikidata")
+                for page in batch:
+                    self.page_state.forget(page.title)
+                    self.page_done(page, 'error')
+                continue
+
+            for page in batch:
+                entity_data = entities.get(page.title)
+                page.entity_revid = entity_data.lastrevid if entity_data else None
+                await out_queue.put((page, entity_data))
+
+    async def transform_pages(self, in_queue, out_queue):
+        while (item := await in_queue.get()) is not None:
+            page, entity_data = item
+            title = page.title
+            if self.stopping():
+                continue
+            try:
+                logging.info(f"מעבד את הדף: {title}")
+                if not page.content:
+                    self.page_done(page, 'empty')
+                    continue
+                changes = []
+                with self.metrics.timer('stage_seconds', stage='transform'):
+                    if self.transform_pool.wants(page.content):
+                        # Long articles would stall every in-flight request if rewritten here
+                        self.metrics.inc('transform_total', mode='process')
+                        new_text = await self.transform_pool.process_page(title, page.content, entity_data, changes)
+                    else:
+                        self.metrics.inc('transform_total', mode='inline')
+                        new_text = self.process_page(title, page.content, entity_data, changes)
+                await out_queue.put((page, new_text, changes))
+            except Exception as e:
+                self.log_progress(f"שגיאה בדף {title}: {str(e)}", is_error=True)
+                self.page_done(page, 'error')
+
+    async def save_edits(self, in_queue, out_queue):
+        # The only stage that writes to the wiki; its pace is set by the edit token bucket
+        while (item := await in_queue.get()) is not None:
+            page, new_text, changes = item
+            title = page.title
+            if self.stopping():
+                continue
+            try:
+                outcome = 'unchanged'
+                if new_text != page.content and self.proposals:
+                    outcome = 'proposed' if self.proposals.write(page, changes, new_text) else 'failed'
+                elif new_text != page.content:
+                    outcome = 'failed'
+                    with self.metrics.timer('stage_seconds', stage='save'):
+                        saved = await self.save_page(title, new_text, self.edit_summary)
+                    if saved:
+                        outcome = 'edited'
+                        self.log_progress(f"נערך הדף: {title}")
+                if outcome == 'unchanged':
+                    self.page_state.record(title, page.revid, page.entity_revid)
+                else:
+                    self.page_state.forget(title)
+                self.page_done(page, outcome)
+                
+                self.processed_count += 1
+                
+                if self.processed_count % CHECKPOINT_INTERVAL == 0:
+                    self.checkpoint.flush()
+                    self.page_state.flush()
+                    self.write_metrics()
+                    if self.leases:
+                        self.leases.renew()
+                
+            except Exception as e:
+                self.log_progress(f"שגיאה בדף {title}: {str(e)}", is_error=True)
+                self.page_done(page, 'error')
+
+    async def run_pipeline(self):
+        titles = asyncio.Queue(self.queue_size)
+        batches = asyncio.Queue(self.queue_size)
+        pages = asyncio.Queue(self.queue_size * WIKIDATA_BATCH_SIZE)
+        edits = asyncio.Queue(self.queue_size * WIKIDATA_BATCH_SIZE)
+        # Enough transform workers to keep every pool process busy on a run of long pages
+        transform_workers = max(self.transform_workers, self.transform_pool.processes)
+
+        await asyncio.gather(
+            self.run_stage(1, self.enumerate_pages, None, titles, self.content_workers),
+            self.run_stage(self.content_workers, self.fetch_contents, titles, batches, self.entity_workers),
+            self.run_stage(self.entity_workers, self.fetch_entities, batches, pages, transform_workers),
+            self.run_stage(transform_workers, self.transform_pages, pages, edits, 1),
+            self.run_stage(1, self.save_edits, edits, None, 0)
+        )
+
+    async def run_partitions(self):
+        """Run the pipeline over lease store partitions until none are left or the run stops
+
+        The lease store takes the place of --resume: each partition starts
+        from a fresh checkpoint, and one left unfinished goes back to the store.
+        """
+        self.resume = False
+        while not self.stopping() and not self.incomplete and (partition := self.leases.claim()) is not None:
+            logging.info(f"Working on partition {partition + 1} of {self.leases.partitions}")
+            self.partition = (partition, self.leases.partitions)
+            await self.run_pipeline()
+            self.leases.release(done=not (self.stop_requested or self.incomplete))
 
     async def run(self):
         logging.info("התחלת ריצת הבוט")
         self.log_progress("התחלת ריצת הבוט")
+        run_started = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        if self.deadline_minutes:
+            self.deadline = time.time() + self.deadline_minutes * 60
+        
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, self.request_stop)
+        except (NotImplementedError, RuntimeError):
+            pass
         
         try:
             if not await self.login():
                 logging.error("Failed to login, stopping bot")
                 return
 
-            async for page in self.get_category_members():
-                try:
-                    title = page['title']
-                    logging.info(f"מעבד את הדף: {title}")
-                    content = await self.get_page_content(title)
-                    
-                    if not content:
-                        continue
-                    
-                    new_text = await self.process_page(title, content)
-                    
-                    if new_text != content:
-                        if await self.save_page(title, new_text, 'שאיבת פרמטרי תבנית מוויקינתונים'):
-                            self.log_progress(f"נערך הדף: {title}")
-                            await asyncio.sleep(1)
-                    
-                    self.processed_count += 1
-                    
-                    if self.processed_count % 200 == 0:
-                        await self.update_wiki_log()
-                    
-                except Exception as e:
-                    error_msg = f"שגיאה בדף {title}: {str(e)}"
-                    self.log_progress(error_msg, is_error=True)
-                    continue
-                    
+            if self.dry_run:
+                self.proposals = ProposalWriter(self.dry_run)
+            elif not self.shard:
+                # Shards leave a report instead, published once by --merge-shards
+                self.wiki_log.start()
+
+            if self.leases:
+                await self.run_partitions()
+            else:
+                await self.run_pipeline()
+
+            if self.stop_requested:
+                self.log_progress(f"הריצה נעצרה לפני סיומה אחרי {self.processed_count} דפים, ניתן להמשיך עם --resume")
+            elif self.incomplete:
+                self.log_progress(f"הריצה הסתיימה לפני סיומה אחרי {self.processed_count} דפים בגלל בקשות שנכשלו, "
+                                  f"ניתן להמשיך עם --resume", is_error=True)
+            else:
+                self.checkpoint.reset()
+                # Nothing was saved, so the next incremental run still looks back to the last real one
+                if not self.dry_run:
+                    self.page_state.set_last_run(run_started)
+
         except Exception as e:
             error_msg = f"שגיאה כללית: {str(e)}"
             self.log_progress(error_msg, is_error=True)
             raise
         finally:
+            await self.wiki_log.stop()
+            if self.shard:
+                write_shard_report(self, self.shard_report_path)
+            if self.leases:
+                self.leases.release(done=False)
+                self.leases.close()
+            if self.proposals:
+                self.proposals.close()
+                logging.info(f"Wrote {self.proposals.count} proposed edits to {self.dry_run}")
+            self.transform_pool.close()
+            self.write_metrics()
+            logging.info(f"{self.metrics.total('requests_total')} API requests, "
+                         f"{self.metrics.total('pages_total', outcome='edited')} edits, "
+                         f"metrics written to {self.metrics_path}")
+            self.checkpoint.close()
+            self.page_state.close()
+            self.resolver.close()
+            self.cache.close()
+            self.run_log.close()
             await self.close_session()
 
+def main(bot_class):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--resume', action='store_true',
+                        help='continue from the checkpoint left by an interrupted run')
+    parser.add_argument('--deadline', type=float, metavar='MINUTES',
+                        help='stop taking new pages after this many minutes and save a checkpoint')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only process pages or Wikidata items that changed since the last run')
+    parser.add_argument('--wikidata-dump', metavar='PATH',
+                        help='Wikidata JSON dump (.json, .gz or .bz2) for an offline run')
+    parser.add_argument('--xml-dump', metavar='PATH',
+                        help='MediaWiki XML export of the wiki for an offline run')
+    parser.add_argument('--output', metavar='PATH',
+                        help=f'where --dry-run and offline runs write their proposed edits '
+                             f'(default: {bot_class.proposals_path})')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='write proposed edits to --output instead of saving them')
+    parser.add_argument('--apply', metavar='PATH',
+                        help='save the edits from a proposal file written by --dry-run or an offline run')
+    parser.add_argument('--metrics', metavar='PATH',
+                        help=f'metrics file, rewritten during the run: Prometheus text, or JSON if it ends in .json '
+                             f'(default: {bot_class.metrics_path})')
+    parser.add_argument('--transform-processes', type=int, metavar='N',
+                        help='processes for transforming long pages (default: one per CPU, 0 to transform in-process)')
+    parser.add_argument('--shard', type=parse_shard, metavar='I/N',
+                        help='process only the titles whose stable hash falls in shard I of N, '
+                             'and leave a shard report instead of updating the wiki log')
+    parser.add_argument('--leases', metavar='PATH',
+                        help='with --shard, take partitions from a SQLite lease store shared by the N workers')
+    parser.add_argument('--merge-shards', nargs='+', metavar='REPORT',
+                        help='publish the shard reports as one wiki log section and merge their metrics')
+    args = parser.parse_args()
+    if args.leases and not args.shard:
+        parser.error('--leases needs --shard I/N')
+
+    # Records are formatted by the QueueHandler and written by the listener's thread
+    log_queue = queue.Queue()
+    bot_log = shard_path(bot_class.bot_log, *args.shard) if args.shard else bot_class.bot_log
+    listener = QueueListener(log_queue, logging.FileHandler(bot_log, encoding='utf-8'),
+                             logging.StreamHandler())
+    listener.start()
+    atexit.register(listener.stop)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[QueueHandler(log_queue)]
+    )
+
+    output = args.output or (shard_path(bot_class.proposals_path, *args.shard) if args.shard
+                             else bot_class.proposals_path)
+    bot = bot_class(resume=args.resume, deadline=args.deadline, incremental=args.incremental,
+                    dry_run=output if args.dry_run else None, shard=args.shard, leases=args.leases)
+    if args.metrics:
+        bot.metrics_path = args.metrics
+    if args.transform_processes is not None:
+        bot.transform_pool.processes = args.transform_processes
+    if args.merge_shards:
+        asyncio.run(merge_shards(bot, args.merge_shards))
+    elif args.apply:
+        asyncio.run(apply_proposals(bot, args.apply))
+    elif args.wikidata_dump or args.xml_dump:
+        if not (args.wikidata_dump and args.xml_dump):
+            parser.error('an offline run needs both --wikidata-dump and --xml-dump')
+        run_offline(bot, args.wikidata_dump, args.xml_dump, output)
+    else:
+        asyncio.run(bot.run())
+
 if __name__ == "__main__":
-    bot = WikidataBot()
-    asyncio.run(bot.run())
+    main(WikidataBot)
@@ -0,0 +1,178 @@
+import json
+from typing import Any, Dict, List, Optional, Union
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if msgspec:
+    BACKEND = 'msgspec'
+    loads = msgspec.json.decode
+elif orjson:
+    BACKEND = 'orjson'
+    loads = orjson.loads
+else:
+    BACKEND = 'json'
+    loads = json.loads
+
+
+class Page:
+    """A listed page and the run state it carries through the pipeline
+
+    content is None for pages that were listed by title only.
+    """
+    __slots__ = ('title', 'ns', 'pageid', 'revid', 'timestamp', 'content', 'continue_param', 'entity_revid')
+
+    def __init__(self, title, ns=0, pageid=None, revid=None, timestamp=None, content=None,
+                 continue_param=None, entity_revid=None):
+        self.title = title
+        self.ns = ns
+        self.pageid = pageid
+        self.revid = revid
+        self.timestamp = timestamp
+        self.content = content
+        self.continue_param = continue_param
+        self.entity_revid = entity_revid
+
+
+class Claim:
+    """Main snak of the first statement of a property"""
+    __slots__ = ('datatype', 'value')
+
+    def __init__(self, datatype, value):
+        self.datatype = datatype
+        self.value = value
+
+
+class Entity:
+    """A Wikidata item reduced to what the templates read
+
+    projection lists the properties claims was built for (None when every
+    claim was kept); claims is None for info-only responses.
+    """
+    __slots__ = ('id', 'lastrevid', 'projection', 'claims')
+
+    def __init__(self, id, lastrevid=None, projection=None, claims=None):
+        self.id = id
+        self.lastrevid = lastrevid
+        self.projection = projection
+        self.claims = claims
+
+    def covers(self, properties):
+        return self.projection is None or set(properties) <= set(self.projection)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'lastrevid': self.lastrevid,
+            'projection': self.projection,
+            'claims': {prop: [claim.datatype, claim.value] for prop, claim in (self.claims or {}).items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        claims = {}
+        for prop, stored in (data.get('claims') or {}).items():
+            if stored and isinstance(stored[0], dict):
+                # Cache rows written before entities were typed keep whole statements
+                claims[prop] = snak_claim(stored[0].get('mainsnak', {}))
+            elif stored:
+                claims[prop] = Claim(*stored)
+        return cls(data.get('id'), data.get('lastrevid'), data.get('projection'), claims)
+
+
+def snak_claim(snak):
+    return Claim(snak.get('datatype'), (snak.get('datavalue') or {}).get('value'))
+
+
+def project(entity, properties):
+    """Entity for a wbgetentities or dump item, keeping the first statement of each property"""
+    if 'claims' not in entity:
+        return Entity(entity.get('id'), entity.get('lastrevid'))
+    claims = entity['claims'] or {}
+    return Entity(entity.get('id'), entity.get('lastrevid'), list(properties),
+                  {prop: snak_claim(claims[prop][0].get('mainsnak', {})) for prop in properties if claims.get(prop)})
+
+
+def query_pages(response):
+    """Pages of a query response that carry a revision
+
+    A page's revision shows up in exactly one response; pages without one
+    here are completed by a later rvcontinue round.
+    """
+    pages = []
+    for page in response['query'].get('pages', {}).values():
+        if page.get('revisions'):
+            revision = page['revisions'][0]
+            pages.append(Page(page['title'], page.get('ns', 0), page.get('pageid'), revision.get('revid'),
+                              revision.get('timestamp'), revision.get('*', '')))
+    return pages
+
+
+if msgspec:
+    class _Snak(msgspec.Struct):
+        datatype: Optional[str] = None
+        datavalue: Optional[Dict[str, Any]] = None
+
+    class _Statement(msgspec.Struct):
+        mainsnak: _Snak
+
+    class _Entity(msgspec.Struct):
+        id: Optional[str] = None
+        lastrevid: Optional[int] = None
+        missing: Optional[str] = None
+        # Statements stay undecoded until a property the templates read is asked for;
+        # an item without statements is serialized as []
+        claims: Union[Dict[str, msgspec.Raw], List[Any], None] = None
+
+    class _EntitiesResponse(msgspec.Struct):
+        entities: Dict[str, _Entity] = {}
+        error: Optional[Dict[str, Any]] = None
+
+    _statements = msgspec.json.Decoder(List[_Statement])
+    _entities_response = msgspec.json.Decoder(_EntitiesResponse)
+
+
+def decode_entities(body, properties):
+    """Decode a wbgetentities body into {'entities': QID -> Entity} plus any 'error'
+
+    Missing items are dropped. With msgspec only the statements of the
+    given properties are ever parsed.
+    """
+    if not msgspec:
+        response = loads(body)
+        decoded = {'entities': {qid: project(entity, properties)
+                                for qid, entity in response.get('entities', {}).items()
+                                if 'missing' not in entity}}
+        if 'error' in response:
+            decoded['error'] = response['error']
+        return decoded
+
+    response = _entities_response.decode(body)
+    entities = {}
+    for qid, entity in response.entities.items():
+        if entity.missing is not None:
+            continue
+        if entity.claims is None:
+            entities[qid] = Entity(entity.id, entity.lastrevid)
+            continue
+        claims = {}
+        statements = entity.claims if isinstance(entity.claims, dict) else {}
+        for prop in properties:
+            if prop in statements:
+                decoded = _statements.decode(statements[prop])
+                if decoded:
+                    snak = decoded[0].mainsnak
+                    claims[prop] = Claim(snak.datatype, (snak.datavalue or {}).get('value'))
+        entities[qid] = Entity(entity.id, entity.lastrevid, list(properties), claims)
+
+    decoded = {'entities': entities}
+    if response.error is not None:
+        decoded['error'] = response.error
+    return decoded
@@ -0,0 +1,216 @@
+import argparse
+import asyncio
+import importlib.util
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import socket
+import subprocess
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+from rate_limiter import RateController
+from stand_in_wiki import serve
+
+RESULTS_PATH = 'benchmark_results.jsonl'
+BENCH_RATE = 1000.0
+# Bot method timed for each pipeline stage
+STAGES = {
+    'wiki_request': 'wiki_request',
+    'entities': 'get_wikidata_claims',
+    'transform': 'process_page',
+    'save': 'save_page',
+}
+
+
+def load_bot_class(name):
+    """WikidataBot or CombinedDateBot; the latter lives in a file that cannot be imported by name"""
+    if name == 'wikidata':
+        from WikidataImportBot import WikidataBot
+        return WikidataBot
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'combined-date-bot.py')
+    spec = importlib.util.spec_from_file_location('combined_date_bot', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.CombinedDateBot
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def server_call(base_url, path, method='GET'):
+    request = urllib.request.Request(base_url + path, method=method, data=b'' if method == 'POST' else None)
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def wait_for_server(base_url, timeout=30):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            return server_call(base_url, '/stats')
+        except OSError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def time_method(bot, name, samples):
+    """Replace bot.<name> with a wrapper that appends each call's duration to samples"""
+    method = getattr(bot, name)
+    if asyncio.iscoroutinefunction(method):
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await method(*args, **kwargs)
+            finally:
+                samples.append(time.perf_counter() - start)
+    else:
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                samples.append(time.perf_counter() - start)
+    setattr(bot, name, timed)
+
+
+def run_bot(name, base_url, rate, transform_processes=None):
+    """Run one bot against the stand-in in a scratch directory; runs in its own process"""
+    logging.basicConfig(level=logging.WARNING)
+    os.chdir(tempfile.mkdtemp(prefix=f'bench-{name}-'))
+    bot = load_bot_class(name)()
+    bot.api_url = bot.wikidata_api_url = bot.hewiki_api_url = base_url + '/w/api.php'
+    if rate:
+        bot.rate = RateController(read_rate=rate, max_read_rate=rate, edit_rate=rate, metrics=bot.metrics)
+    if transform_processes is not None:
+        bot.transform_pool.processes = transform_processes
+
+    samples = {stage: [] for stage in STAGES}
+    for stage, method in STAGES.items():
+        time_method(bot, method, samples[stage])
+
+    server_call(base_url, '/reset', 'POST')
+    start = time.perf_counter()
+    asyncio.run(bot.run())
+    elapsed = time.perf_counter() - start
+    stats = server_call(base_url, '/stats')
+
+    pages = bot.processed_count
+    return {
+        'bot': name,
+        'pages': pages,
+        'elapsed': round(elapsed, 3),
+        'pages_per_sec': round(pages / elapsed, 2) if elapsed else None,
+        'requests': stats['requests'],
+        'requests_per_page': round(stats['requests'] / pages, 3) if pages else None,
+        'requests_by_action': stats['actions'],
+        'server_errors': stats['errors'],
+        'edits': stats['edits'],
+        'bytes_received': stats['bytes_out'],
+        'stage_latency_ms': {stage: {'count': len(values),
+                                     'p50': round(percentile(values, 0.5) * 1000, 3) if values else None,
+                                     'p99': round(percentile(values, 0.99) * 1000, 3) if values else None}
+                             for stage, values in samples.items()},
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def previous_result(path, result):
+    """Last saved result for the same bot and scenario, to compare against"""
+    scenario = ('bot', 'corpus_pages', 'page_size', 'latency_ms', 'error_rate', 'rate', 'transform_processes')
+    previous = None
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    saved = json.loads(line)
+                except ValueError:
+                    continue
+                if all(saved.get(key) == result.get(key) for key in scenario):
+                    previous = saved
+    return previous
+
+
+def report(result, previous):
+    print(f"\n{result['bot']}: {result['pages']} pages in {result['elapsed']}s, "
+          f"{result['pages_per_sec']} pages/s, {result['requests_per_page']} requests/page, "
+          f"peak RSS {result['peak_rss_mb']} MB")
+    for stage, latency in result['stage_latency_ms'].items():
+        print(f"  {stage:<14} n={latency['count']:<6} p50={latency['p50']} ms  p99={latency['p99']} ms")
+    if previous and previous.get('pages_per_sec') and result['pages_per_sec']:
+        change = (result['pages_per_sec'] / previous['pages_per_sec'] - 1) * 100
+        print(f"  vs {previous.get('revision')} ({previous.get('timestamp')}): {change:+.1f}% pages/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the bots against a local stand-in wiki')
+    parser.add_argument('--pages', type=int, default=500, help='articles in the synthetic corpus')
+    parser.add_argument('--page-size', type=int, default=4000, help='approximate article length in characters')
+    parser.add_argument('--latency', type=float, default=20, metavar='MS', help='mean server latency per request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with 503')
+    parser.add_argument('--rate', type=float, default=BENCH_RATE,
+                        help='requests/s allowed by the bot rate controller; 0 keeps the production rates')
+    parser.add_argument('--bots', default='wikidata,combined', help='comma separated: wikidata, combined')
+    parser.add_argument('--output', default=RESULTS_PATH, help='JSON-lines file the results are appended to')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--transform-processes', type=int, metavar='N',
+                        help="the bots' process pool size for long pages (default: their own, one per CPU)")
+    args = parser.parse_args()
+
+    port = free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    server = multiprocessing.Process(target=serve, daemon=True,
+                                     args=(port, args.pages, args.page_size, args.latency / 1000,
+                                           args.error_rate, args.seed))
+    server.start()
+    try:
+        wait_for_server(base_url)
+        for name in args.bots.split(','):
+            # A fresh process per bot, so peak RSS belongs to that bot alone
+            with ProcessPoolExecutor(1) as pool:
+                result = pool.submit(run_bot, name, base_url, args.rate, args.transform_processes).result()
+            result.update({
+                'timestamp': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'revision': git_revision(),
+                'corpus_pages': args.pages,
+                'page_size': args.page_size,
+                'latency_ms': args.latency,
+                'error_rate': args.error_rate,
+                'rate': args.rate,
+                'transform_processes': args.transform_processes,
+            })
+            report(result, previous_result(args.output, result))
+            with open(args.output, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(result, ensure_ascii=False) + '\n')
+    finally:
+        server.terminate()
+        server.join()
+
+
+if __name__ == '__main__':
+    main()
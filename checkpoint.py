@@ -0,0 +1,95 @@
+import json
+import logging
+import sqlite3
+
+# Outcomes that finish a page for this sweep; pages that failed or hit an error
+# keep their listing chunk open and are retried on --resume
+DONE_OUTCOMES = ('edited', 'unchanged', 'proposed', 'empty', 'filtered')
+
+
+class Checkpoint:
+    """Resumable run state: listing continue token plus completed titles
+
+    Pages are registered with the continue token of the listing chunk they came
+    from. The saved resume token is the oldest chunk that still has unfinished
+    or failed pages, so a killed run restarts no later than its earliest
+    in-flight or failed page and skips titles recorded with a DONE_OUTCOMES
+    outcome.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS state (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS pages (
+                title TEXT PRIMARY KEY,
+                outcome TEXT NOT NULL,
+                revid INTEGER
+            );
+        ''')
+        self.chunks = {}
+        self.chunk_of = {}
+        self.next_token = None
+        self.pending = []
+
+    def reset(self):
+        self.chunks = {}
+        self.chunk_of = {}
+        self.next_token = None
+        self.pending = []
+        self.db.execute('DELETE FROM state')
+        self.db.execute('DELETE FROM pages')
+        self.db.commit()
+
+    def load(self):
+        """Return (continue token, completed titles) saved by the previous run"""
+        row = self.db.execute("SELECT value FROM state WHERE key = 'continue'").fetchone()
+        token = json.loads(row[0]) if row and row[0] else None
+        completed = {title for title, outcome in self.db.execute('SELECT title, outcome FROM pages')
+                     if outcome in DONE_OUTCOMES}
+        return token, completed
+
+    def page_started(self, title, token):
+        if title in self.chunk_of:
+            return
+        key = json.dumps(token or {}, sort_keys=True)
+        self.chunks.setdefault(key, [token, 0])[1] += 1
+        self.chunk_of[title] = key
+
+    def listing_advanced(self, token):
+        """Record the continue token of the listing request about to be sent"""
+        self.next_token = token
+
+    def page_done(self, title, outcome, revid=None):
+        self.pending.append((title, outcome, revid))
+        key = self.chunk_of.pop(title, None)
+        if key in self.chunks and outcome in DONE_OUTCOMES:
+            self.chunks[key][1] -= 1
+
+    def resume_token(self):
+        # dicts keep insertion order, which is listing order
+        for token, outstanding in self.chunks.values():
+            if outstanding > 0:
+                return token
+        return self.next_token
+
+    def flush(self):
+        try:
+            self.db.executemany('INSERT OR REPLACE INTO pages VALUES (?, ?, ?)', self.pending)
+            self.db.execute('INSERT OR REPLACE INTO state VALUES (?, ?)',
+                            ('continue', json.dumps(self.resume_token())))
+            self.db.commit()
+            self.pending = []
+            self.chunks = {key: chunk for key, chunk in self.chunks.items() if chunk[1] > 0}
+        except sqlite3.Error as e:
+            logging.error(f"Error writing checkpoint: {str(e)}")
+
+    def close(self):
+        if self.db:
+            self.flush()
+            self.db.close()
+            self.db = None
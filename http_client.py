@@ -0,0 +1,69 @@
+import logging
+from urllib.parse import urlparse
+
+import aiohttp
+
+try:
+    import brotli  # noqa: F401  aiohttp decodes br bodies when a Brotli module is importable
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        ACCEPT_ENCODING = 'gzip, deflate, br'
+    except ImportError:
+        ACCEPT_ENCODING = 'gzip, deflate'
+
+USER_AGENT = 'WikidataImportBot/1.0 (https://www.hamichlol.org.il/משתמש:נריה_בוט) aiohttp/' + aiohttp.__version__
+CONNECTIONS_PER_HOST = 8
+KEEPALIVE_TIMEOUT = 30
+DNS_CACHE_TTL = 600
+# Per request kind; edits are slow server-side and Wikidata batches are large
+TIMEOUTS = {
+    'read': aiohttp.ClientTimeout(total=60, sock_connect=10, sock_read=45),
+    'wikidata': aiohttp.ClientTimeout(total=120, sock_connect=10, sock_read=90),
+    'edit': aiohttp.ClientTimeout(total=180, sock_connect=10, sock_read=150),
+}
+
+
+class HttpClient:
+    """One pooled ClientSession per host, shared by every request a bot makes
+
+    Each host gets its own TCPConnector, so a slow host cannot hold the
+    connections another one needs and the wiki login cookies stay with the
+    wiki. Connections are kept alive and reused, lookups go through the
+    connector's DNS cache, and TLS is verified with the default context.
+    """
+
+    def __init__(self, limits=None, limit=CONNECTIONS_PER_HOST, timeouts=None):
+        self.limits = limits or {}
+        self.limit = limit
+        self.timeouts = dict(TIMEOUTS, **(timeouts or {}))
+        self.sessions = {}
+
+    def session(self, host):
+        if host not in self.sessions:
+            connector = aiohttp.TCPConnector(
+                limit=self.limits.get(host, self.limit),
+                keepalive_timeout=KEEPALIVE_TIMEOUT,
+                use_dns_cache=True,
+                ttl_dns_cache=DNS_CACHE_TTL
+            )
+            self.sessions[host] = aiohttp.ClientSession(
+                connector=connector,
+                headers={'User-Agent': USER_AGENT, 'Accept-Encoding': ACCEPT_ENCODING},
+                timeout=self.timeouts['read']
+            )
+        return self.sessions[host]
+
+    def request(self, method, url, kind='read', **kwargs):
+        """session.request on the pool for url's host, with the timeout for `kind`"""
+        session = self.session(urlparse(url).hostname)
+        return session.request(method, url, timeout=self.timeouts.get(kind, self.timeouts['read']), **kwargs)
+
+    async def close(self):
+        sessions, self.sessions = self.sessions, {}
+        for host, session in sessions.items():
+            try:
+                await session.close()
+            except Exception as e:
+                logging.error(f"Error closing connections to {host}: {str(e)}")
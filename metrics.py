@@ -0,0 +1,162 @@
+import json
+import logging
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+PREFIX = 'wikidatabot_'
+# Upper bounds in seconds; wide enough for cheap transforms and throttled edits alike
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, fraction):
+        """Upper bound of the bucket holding the given quantile"""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class Metrics:
+    """Labelled counters, gauges and latency histograms for one run
+
+    Exported as a Prometheus textfile (any path not ending in .json) or a JSON
+    summary. The file is replaced atomically, so a collector or a person
+    reading it mid-run never sees a partial write.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.started = time.time()
+
+    def key(self, name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self.key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        self.gauges[self.key(name, labels)] = value
+
+    def observe(self, name, seconds, **labels):
+        key = self.key(name, labels)
+        if key not in self.histograms:
+            self.histograms[key] = Histogram()
+        self.histograms[key].observe(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def total(self, name, **labels):
+        """Sum of a counter over every label set that includes `labels`"""
+        return sum(value for (counter, counter_labels), value in self.counters.items()
+                   if counter == name and set(labels.items()) <= set(counter_labels))
+
+    def label_text(self, labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ''
+        escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+                   for _, value in pairs)
+        return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+    def to_prometheus(self):
+        lines = []
+        typed = set()
+
+        def header(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {PREFIX}{name} {kind}')
+
+        for (name, labels), value in sorted(self.counters.items()):
+            header(name, 'counter')
+            lines.append(f'{PREFIX}{name}{self.label_text(labels)} {value}')
+        for (name, labels), value in sorted(self.gauges.items()):
+            header(name, 'gauge')
+            lines.append(f'{PREFIX}{name}{self.label_text(labels)} {value}')
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, count in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+                cumulative += count
+                lines.append(f'{PREFIX}{name}_bucket{self.label_text(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{PREFIX}{name}_sum{self.label_text(labels)} {histogram.sum:.6f}')
+            lines.append(f'{PREFIX}{name}_count{self.label_text(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def bound_text(self, bound):
+        return '+Inf' if bound == float('inf') else bound
+
+    def to_dict(self):
+        def entries(items, render):
+            grouped = {}
+            for (name, labels), value in sorted(items):
+                grouped.setdefault(name, []).append(dict(labels=dict(labels), **render(value)))
+            return grouped
+
+        return {
+            'elapsed': round(time.time() - self.started, 3),
+            'counters': entries(self.counters.items(), lambda value: {'value': value}),
+            'gauges': entries(self.gauges.items(), lambda value: {'value': value}),
+            'histograms': entries(self.histograms.items(), lambda histogram: {
+                'count': histogram.count,
+                'sum': round(histogram.sum, 6),
+                'p50': self.bound_text(histogram.quantile(0.5)),
+                'p99': self.bound_text(histogram.quantile(0.99)),
+                'buckets': histogram.counts,
+            }),
+        }
+
+    def merge(self, data):
+        """Add in another run's to_dict() output; counters, gauges and histograms are summed"""
+        for name, entries in data.get('counters', {}).items():
+            for entry in entries:
+                self.inc(name, entry['value'], **entry['labels'])
+        for name, entries in data.get('gauges', {}).items():
+            for entry in entries:
+                key = self.key(name, entry['labels'])
+                self.gauges[key] = self.gauges.get(key, 0) + entry['value']
+        for name, entries in data.get('histograms', {}).items():
+            for entry in entries:
+                key = self.key(name, entry['labels'])
+                histogram = self.histograms.setdefault(key, Histogram())
+                histogram.counts = [ours + theirs for ours, theirs in zip(histogram.counts, entry['buckets'])]
+                histogram.count += entry['count']
+                histogram.sum += entry['sum']
+
+    def write(self, path):
+        try:
+            content = (json.dumps(self.to_dict(), ensure_ascii=False, indent=1) if path.endswith('.json')
+                       else self.to_prometheus())
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                f.write(content)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            logging.error(f"Error writing metrics to {path}: {str(e)}")
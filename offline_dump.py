@@ -0,0 +1,103 @@
+import bz2
+import gzip
+import logging
+import xml.etree.ElementTree as ElementTree
+
+from api_decode import Page, loads
+from proposals import ProposalWriter
+
+
+def open_dump(path):
+    """Open a plain, .gz or .bz2 dump for line-wise text reading"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rt', encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+def build_index(bot, wikidata_dump):
+    """Map normalized hewiki titles to entities projected onto bot.properties
+
+    Items without a hewiki sitelink or without any of the needed properties
+    are dropped, so the index only holds what the templates can use.
+    """
+    index = {}
+    scanned = 0
+    with open_dump(wikidata_dump) as dump:
+        for line in dump:
+            scanned += 1
+            if scanned % 1000000 == 0:
+                logging.info(f"Scanned {scanned} dump entities, {len(index)} indexed")
+            # Cheap substring test before paying for a JSON parse
+            if '"hewiki"' not in line:
+                continue
+            line = line.strip().rstrip(',')
+            if not line.startswith('{'):
+                continue
+            try:
+                entity = loads(line)
+            except ValueError as e:
+                logging.error(f"Skipping malformed dump line {scanned}: {str(e)}")
+                continue
+
+            sitelink = entity.get('sitelinks', {}).get('hewiki')
+            if not sitelink:
+                continue
+            projected = bot.project_entity(entity)
+            if projected.claims:
+                index[bot.normalize_title(sitelink['title'])] = projected
+
+    logging.info(f"Indexed {len(index)} of {scanned} dump entities")
+    return index
+
+
+def local_name(element):
+    return element.tag.rsplit('}', 1)[-1]
+
+
+def iter_xml_pages(xml_dump):
+    """Yield the latest revision of every page in a MediaWiki XML export"""
+    with open_dump(xml_dump) as dump:
+        context = ElementTree.iterparse(dump, events=('start', 'end'))
+        _, root = next(context)
+        for event, element in context:
+            if event != 'end' or local_name(element) != 'page':
+                continue
+
+            fields = {local_name(child): child for child in element}
+            revisions = [child for child in element if local_name(child) == 'revision']
+            if revisions:
+                revision = {local_name(child): child for child in revisions[-1]}
+                yield Page(
+                    fields['title'].text or '',
+                    ns=int(fields['ns'].text) if 'ns' in fields else 0,
+                    pageid=int(fields['id'].text) if 'id' in fields else None,
+                    revid=int(revision['id'].text) if 'id' in revision else None,
+                    timestamp=revision['timestamp'].text if 'timestamp' in revision else None,
+                    content=revision['text'].text or '' if 'text' in revision else ''
+                )
+            root.clear()
+
+
+def run_offline(bot, wikidata_dump, xml_dump, output):
+    """Run bot.process_page over an XML export, writing proposed edits as JSON lines"""
+    index = build_index(bot, wikidata_dump)
+    proposals = ProposalWriter(output)
+    try:
+        for page in iter_xml_pages(xml_dump):
+            if page.ns != 0 or not page.content:
+                continue
+            entity = index.get(bot.normalize_title(bot.wikidata_title(page.title)))
+            if not entity:
+                continue
+
+            changes = []
+            new_text = bot.process_page(page.title, page.content, entity, changes)
+            if new_text != page.content:
+                proposals.write(page, changes, new_text)
+    finally:
+        proposals.close()
+
+    logging.info(f"Wrote {proposals.count} proposed edits to {output}")
+    return proposals.count
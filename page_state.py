@@ -0,0 +1,73 @@
+import logging
+import sqlite3
+
+from wikidata_cache import CACHE_PATH
+
+
+class PageState:
+    """Page and entity revisions seen when a page was last left unchanged
+
+    Lives next to the entity cache so both survive between runs together.
+    """
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self.pending = {}
+        self.db = sqlite3.connect(path)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS page_state (
+                title TEXT PRIMARY KEY,
+                revid INTEGER,
+                entity_revid INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS runs (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        ''')
+
+    def close(self):
+        if self.db:
+            self.flush()
+            self.db.close()
+            self.db = None
+
+    def last_run(self):
+        row = self.db.execute("SELECT value FROM runs WHERE key = 'last_run'").fetchone()
+        return row[0] if row else None
+
+    def set_last_run(self, timestamp):
+        self.db.execute("INSERT OR REPLACE INTO runs VALUES ('last_run', ?)", (timestamp,))
+        self.db.commit()
+
+    def get(self, titles):
+        """Return title -> (revid, entity_revid) for the titles that have a state"""
+        states = {}
+        for title in titles:
+            if title in self.pending:
+                row = self.pending[title]
+            else:
+                row = self.db.execute('SELECT revid, entity_revid FROM page_state WHERE title = ?',
+                                      (title,)).fetchone()
+            if row:
+                states[title] = tuple(row)
+        return states
+
+    def record(self, title, revid, entity_revid):
+        self.pending[title] = (revid, entity_revid)
+
+    def forget(self, title):
+        self.pending[title] = None
+
+    def flush(self):
+        # Written in one transaction so the shared cache file is never held locked
+        try:
+            for title, state in self.pending.items():
+                if state is None:
+                    self.db.execute('DELETE FROM page_state WHERE title = ?', (title,))
+                else:
+                    self.db.execute('INSERT OR REPLACE INTO page_state VALUES (?, ?, ?)', (title, *state))
+            self.db.commit()
+            self.pending = {}
+        except sqlite3.Error as e:
+            logging.error(f"Error writing page state: {str(e)}")
@@ -0,0 +1,150 @@
+import json
+import logging
+from collections import Counter
+
+from wikitext import scan_templates
+
+PROPOSAL_BATCH_SIZE = 50
+
+
+class ProposalWriter:
+    """JSON-lines file of proposed edits
+
+    Each line holds the page title, the base revision the proposal was computed
+    from, the templates it fills and the edit itself as [old, new, occurrence]
+    invocation changes, which is far smaller than the page text and can be
+    replayed onto a newer revision. occurrence tells apart calls with the
+    same text; see apply_changes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self.file = open(path, 'w', encoding='utf-8')
+
+    def write(self, page, changes, new_text):
+        """Record process_page's changes to page; False if replaying them would not give new_text"""
+        occurrences = {invocation.start: occurrence
+                       for (_, occurrence), invocation in numbered_invocations(page.content).items()}
+        recorded = [[old, new, occurrences[start]] for _, start, old, new in changes]
+        if apply_changes(page.content, recorded) != new_text:
+            logging.error(f"Not proposing {page.title}: the recorded changes do not reproduce the edit")
+            return False
+
+        self.count += 1
+        self.file.write(json.dumps({
+            'title': page.title,
+            'revid': page.revid,
+            'timestamp': page.timestamp,
+            'templates': sorted({name for name, _, _, _ in changes}),
+            'changes': recorded
+        }, ensure_ascii=False) + '\n')
+        return True
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+def read_proposals(path):
+    with open(path, encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                logging.error(f"Skipping malformed proposal on line {number}: {str(e)}")
+
+
+def numbered_invocations(text):
+    """Scanned invocations keyed by (text, how many earlier ones have the same text)"""
+    seen = Counter()
+    numbered = {}
+    for invocation in scan_templates(text):
+        source = text[invocation.start:invocation.end]
+        numbered[source, seen[source]] = invocation
+        seen[source] += 1
+    return numbered
+
+
+def apply_changes(text, changes):
+    """Replay [old, new, occurrence] changes onto text; None if an old invocation is gone
+
+    Each change rewrites only the occurrence-th scanned call whose text is
+    old, so identical calls elsewhere on the page, and copies inside
+    comments or nowiki, stay as they are.
+    """
+    numbered = numbered_invocations(text)
+    targets = []
+    for old, new, occurrence in changes:
+        invocation = numbered.get((old, occurrence))
+        if invocation is None:
+            return None
+        targets.append((invocation.start, invocation.end, new))
+
+    parts = []
+    position = 0
+    for start, end, new in sorted(targets):
+        if start < position:
+            return None  # Overlapping calls; the page changed too much to replay
+        parts.append(text[position:start])
+        parts.append(new)
+        position = end
+    parts.append(text[position:])
+    return ''.join(parts)
+
+
+async def apply_batch(bot, batch):
+    pages = await bot.get_pages_content([p['title'] for p in batch])
+    if pages is None:
+        bot.log_progress(f"שליפת {len(batch)} דפים נכשלה, ההצעות שלהם דולגו", is_error=True)
+        return 0
+    current = {page.title: page for page in pages}
+    applied = 0
+    for proposal in batch:
+        title = proposal['title']
+        page = current.get(title)
+        if not page:
+            bot.log_progress(f"הדף {title} לא נמצא, ההצעה דולגה", is_error=True)
+            continue
+
+        rebased = page.revid != proposal['revid']
+        new_text = apply_changes(page.content, proposal['changes'])
+        if new_text is None or new_text == page.content:
+            logging.info(f"Skipping {title}: proposal no longer applies to revision {page.revid}")
+            continue
+
+        # baserevid/basetimestamp make the wiki reject the save if the page moved on meanwhile
+        if await bot.save_page(title, new_text, bot.edit_summary,
+                               baserevid=page.revid, basetimestamp=page.timestamp):
+            applied += 1
+            bot.log_progress(f"נערך הדף: {title}" + (" (לאחר התאמה לגרסה חדשה)" if rebased else ""))
+    return applied
+
+
+async def apply_proposals(bot, path):
+    """Save the edits in a proposal file without repeating any Wikidata lookups"""
+    applied = 0
+    try:
+        if not await bot.login():
+            logging.error("Failed to login, not applying proposals")
+            return 0
+
+        batch = []
+        for proposal in read_proposals(path):
+            batch.append(proposal)
+            if len(batch) >= PROPOSAL_BATCH_SIZE:
+                applied += await apply_batch(bot, batch)
+                batch = []
+        if batch:
+            applied += await apply_batch(bot, batch)
+
+        logging.info(f"Applied {applied} proposed edits from {path}")
+        await bot.update_wiki_log()
+        return applied
+    finally:
+        bot.write_metrics()
+        bot.run_log.close()
+        await bot.close_session()
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import time
+from urllib.parse import urlparse
+
+import aiohttp
+
+from api_decode import loads
+from metrics import Metrics
+
+MAXLAG = 5
+READ_RATE = 5.0
+MAX_READ_RATE = 20.0
+EDIT_RATE = 1.0
+MIN_RATE = 0.2
+RETRY_ATTEMPTS = 5
+THROTTLE_CODES = ('maxlag', 'ratelimited')
+
+
+class TokenBucket:
+    def __init__(self, rate, max_rate, capacity=None):
+        self.rate = rate
+        self.max_rate = max_rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def slow_down(self):
+        self.rate = max(MIN_RATE, self.rate / 2)
+        self.tokens = min(self.tokens, 0)
+
+    def speed_up(self):
+        self.rate = min(self.max_rate, self.rate + 0.1)
+
+
+class RateController:
+    """Per-host read/edit token buckets that adapt to maxlag and rate-limit responses
+
+    Every request carries maxlag. A maxlag or ratelimited error, HTTP 429/503
+    or Retry-After pauses the host and halves its rate; successes grow the
+    rate back towards its ceiling.
+    """
+
+    def __init__(self, read_rate=READ_RATE, max_read_rate=MAX_READ_RATE, edit_rate=EDIT_RATE,
+                 maxlag=MAXLAG, attempts=RETRY_ATTEMPTS, metrics=None):
+        self.read_rate = read_rate
+        self.max_read_rate = max_read_rate
+        self.edit_rate = edit_rate
+        self.maxlag = maxlag
+        self.attempts = attempts
+        self.buckets = {}
+        self.paused_until = {}
+        self.metrics = metrics or Metrics()
+
+    def bucket(self, host, kind):
+        if (host, kind) not in self.buckets:
+            if kind == 'edit':
+                self.buckets[(host, kind)] = TokenBucket(self.edit_rate, self.edit_rate, capacity=1)
+            else:
+                self.buckets[(host, kind)] = TokenBucket(self.read_rate, self.max_read_rate)
+        return self.buckets[(host, kind)]
+
+    async def acquire(self, host, kind):
+        pause = self.paused_until.get(host, 0) - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        await self.bucket(host, kind).acquire()
+
+    def throttled(self, host, kind, delay):
+        self.metrics.inc('throttled_total', host=host, kind=kind)
+        self.paused_until[host] = max(self.paused_until.get(host, 0), time.monotonic() + delay)
+        self.bucket(host, kind).slow_down()
+        logging.warning(f"Throttled by {host}, pausing {delay:.1f}s "
+                        f"({kind} rate now {self.bucket(host, kind).rate:.2f}/s)")
+
+    def retry_after(self, response):
+        try:
+            return float(response.headers.get('Retry-After', ''))
+        except ValueError:
+            return None
+
+    async def request(self, client, method, url, data, kind='read', decode=loads, resend=True, **kwargs):
+        """Send an API request through an HttpClient, retrying through throttling
+
+        kind picks both the token bucket and the client's timeout: 'read',
+        'wikidata' (paced like reads, with a longer timeout) or 'edit'.
+        decode turns the body into a dict; returns it, or None if no attempt
+        got one. With resend=False, for requests that must not be applied
+        twice such as appends, a request that may have reached the server
+        (a timeout, a dropped connection, an unreadable answer) is not retried.
+        """
+        host = urlparse(url).hostname
+        action = data.get('action', '')
+        data = dict(data, maxlag=self.maxlag)
+        result = None
+
+        for attempt in range(self.attempts):
+            if attempt:
+                self.metrics.inc('retries_total', host=host, action=action)
+            await self.acquire(host, kind)
+            started = time.perf_counter()
+            status = 'error'
+            try:
+                async with client.request(method, url, kind,
+                                          params=data if method == 'get' else None,
+                                          data=data if method == 'post' else None,
+                                          **kwargs) as response:
+                    status = str(response.status)
+                    retry_after = self.retry_after(response)
+                    if response.status in (429, 503):
+                        self.throttled(host, kind, retry_after or 2 ** attempt)
+                        continue
+                    response.raise_for_status()
+                    body = await response.read()
+                    self.metrics.inc('response_bytes_total', len(body), host=host, action=action)
+                    result = decode(body)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                logging.error(f"Request to {host} failed (attempt {attempt + 1}): {str(e)}")
+                if not resend and not isinstance(e, aiohttp.ClientConnectorError):
+                    logging.error(f"Not resending the {action} request to {host}, it may already have been applied")
+                    return None
+                await asyncio.sleep(2 ** attempt)
+                continue
+            finally:
+                self.metrics.inc('requests_total', host=host, action=action, status=status)
+                self.metrics.observe('request_seconds', time.perf_counter() - started, host=host, action=action)
+
+            error = result.get('error', {}) if isinstance(result, dict) else {}
+            if error.get('code') in THROTTLE_CODES:
+                self.throttled(host, kind, retry_after or float(error.get('lag', 0)) or 2 ** attempt)
+                continue
+
+            self.bucket(host, kind).speed_up()
+            return result
+
+        logging.error(f"Giving up on {host} after {self.attempts} attempts")
+        return result
@@ -0,0 +1,76 @@
+import atexit
+import logging
+import queue
+from collections import deque
+from logging.handlers import MemoryHandler, QueueListener, RotatingFileHandler
+
+UNPUBLISHED_ENTRIES = 1000
+MAX_BYTES = 5 * 1024 * 1024
+BACKUPS = 3
+BUFFERED_LINES = 50
+QUEUE_SIZE = 10000
+
+
+class RunLog:
+    """Local run log plus the edits and errors waiting to be published on the wiki
+
+    Entries not yet published live in a fixed-size ring buffer next to
+    running totals, so memory does not grow with the length of a run; if
+    publishing falls behind, the oldest are dropped and counted. Lines for the file go
+    through a bounded queue to a background thread that writes them in
+    batches and rotates the file by size; record() never touches the disk.
+    If the queue is full, lines are dropped and counted rather than blocking
+    the caller.
+    """
+
+    def __init__(self, path, unpublished=UNPUBLISHED_ENTRIES, max_bytes=MAX_BYTES, backups=BACKUPS):
+        self.path = path
+        self.unpublished = deque(maxlen=unpublished)
+        self.omitted = 0
+        self.counts = {'edit': 0, 'error': 0}
+        self.dropped = 0
+        self.queue = queue.Queue(QUEUE_SIZE)
+
+        self.file_handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups,
+                                                encoding='utf-8', delay=True)
+        self.file_handler.setFormatter(logging.Formatter('%(asctime)s: %(message)s', '%Y-%m-%d %H:%M:%S'))
+        self.buffer = MemoryHandler(BUFFERED_LINES, flushLevel=logging.CRITICAL, target=self.file_handler)
+        self.listener = QueueListener(self.queue, self.buffer)
+        self.listener.start()
+        atexit.register(self.close)
+
+    def record(self, message, kind=None):
+        """Queue a line for the file; kind 'edit' or 'error' also keeps it for the wiki summary"""
+        if kind:
+            if len(self.unpublished) == self.unpublished.maxlen:
+                self.omitted += 1
+            self.unpublished.append((kind, message))
+            self.counts[kind] += 1
+        try:
+            self.queue.put_nowait(logging.LogRecord('run_log', logging.INFO, self.path, 0, message, None, None))
+        except queue.Full:
+            self.dropped += 1
+
+    def take_unpublished(self):
+        """Return and clear the waiting (kind, message) entries and how many were dropped"""
+        entries, omitted = list(self.unpublished), self.omitted
+        self.unpublished.clear()
+        self.omitted = 0
+        return entries, omitted
+
+    def requeue(self, entries):
+        """Put entries that failed to publish back in front of the newer ones"""
+        room = self.unpublished.maxlen - len(self.unpublished)
+        if len(entries) > room:
+            self.omitted += len(entries) - room
+            entries = entries[len(entries) - room:]
+        self.unpublished.extendleft(reversed(entries))
+
+    def close(self):
+        if self.listener:
+            self.listener.stop()
+            self.listener = None
+            self.buffer.close()
+            self.file_handler.close()
+            if self.dropped:
+                logging.warning(f"{self.dropped} lines were dropped from {self.path}")
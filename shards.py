@@ -0,0 +1,157 @@
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import time
+import zlib
+
+PARTITIONS_PER_WORKER = 4
+LEASE_SECONDS = 15 * 60
+
+
+def parse_shard(text):
+    """'i/N' -> (i, N), for argparse"""
+    try:
+        index, count = (int(part) for part in text.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected I/N, got {text!r}")
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard index must be between 0 and {count - 1}")
+    return index, count
+
+
+def shard_of(title, count):
+    """Partition of a title; crc32 is stable across processes and machines, unlike hash()"""
+    return zlib.crc32(title.encode('utf-8')) % count
+
+
+def shard_path(path, index, count):
+    stem, extension = os.path.splitext(path)
+    return f"{stem}.shard-{index}-of-{count}{extension}"
+
+
+class LeaseStore:
+    """Partitions of the title space handed out to workers through a shared SQLite file
+
+    A worker claims the first partition nobody holds, or whose holder let
+    the lease expire, and renews the lease as it goes; a worker that finishes
+    early simply claims the next one, so a slow or dead worker does not hold
+    up the run. One file covers one sweep over the wiki: once every
+    partition is done, claim() returns None until the file is removed.
+    """
+
+    def __init__(self, path, partitions, worker, lease_seconds=LEASE_SECONDS):
+        self.path = path
+        self.partitions = partitions
+        self.worker = worker
+        self.lease_seconds = lease_seconds
+        self.partition = None
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS partitions (
+                partition INTEGER PRIMARY KEY,
+                worker TEXT,
+                expires REAL,
+                done INTEGER NOT NULL DEFAULT 0
+            );
+        ''')
+        self.db.execute('BEGIN IMMEDIATE')
+        existing = self.db.execute('SELECT COUNT(*) FROM partitions').fetchone()[0]
+        if not existing:
+            self.db.executemany('INSERT INTO partitions (partition) VALUES (?)',
+                                [(partition,) for partition in range(partitions)])
+        self.db.execute('COMMIT')
+        if existing and existing != partitions:
+            raise ValueError(f"{path} was created for {existing} partitions, not {partitions}")
+
+    def claim(self):
+        """Lease the next open partition and return its number, or None when all are taken or done"""
+        now = time.time()
+        self.db.execute('BEGIN IMMEDIATE')
+        row = self.db.execute('''
+            SELECT partition FROM partitions
+            WHERE done = 0 AND (worker IS NULL OR worker = ? OR expires < ?)
+            ORDER BY partition LIMIT 1
+        ''', (self.worker, now)).fetchone()
+        if row:
+            self.db.execute('UPDATE partitions SET worker = ?, expires = ? WHERE partition = ?',
+                            (self.worker, now + self.lease_seconds, row[0]))
+        self.db.execute('COMMIT')
+        self.partition = row[0] if row else None
+        return self.partition
+
+    def renew(self):
+        if self.partition is None:
+            return
+        updated = self.db.execute('UPDATE partitions SET expires = ? WHERE partition = ? AND worker = ?',
+                                  (time.time() + self.lease_seconds, self.partition, self.worker)).rowcount
+        if not updated:
+            logging.warning(f"Lease on partition {self.partition} was taken over by another worker")
+
+    def release(self, done):
+        """Give the partition back, marking it done or open for another worker"""
+        if self.partition is None:
+            return
+        if done:
+            self.db.execute('UPDATE partitions SET done = 1, worker = NULL, expires = NULL WHERE partition = ?',
+                            (self.partition,))
+        else:
+            self.db.execute('UPDATE partitions SET worker = NULL, expires = NULL WHERE partition = ? AND worker = ?',
+                            (self.partition, self.worker))
+        self.partition = None
+
+    def close(self):
+        if self.db:
+            self.db.close()
+            self.db = None
+
+
+def write_shard_report(bot, path):
+    """Save what the shard would have published on the wiki, for merge_shards"""
+    entries, omitted = bot.run_log.take_unpublished()
+    report = {
+        'shard': list(bot.shard),
+        'processed': bot.processed_count,
+        'counts': bot.run_log.counts,
+        'omitted': omitted,
+        'entries': entries,
+        'metrics': bot.metrics.to_dict(),
+    }
+    try:
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False)
+        os.replace(path + '.tmp', path)
+        logging.info(f"Wrote shard report to {path}")
+    except OSError as e:
+        logging.error(f"Error writing shard report {path}: {str(e)}")
+
+
+async def merge_shards(bot, paths):
+    """Fold shard reports into one run log and metrics file and publish a single wiki log section"""
+    counts = {'edit': 0, 'error': 0}
+    for path in paths:
+        try:
+            with open(path, encoding='utf-8') as f:
+                report = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(f"Skipping shard report {path}: {str(e)}")
+            continue
+        bot.processed_count += report['processed']
+        for kind, message in report['entries']:
+            bot.run_log.record(message, kind)
+        bot.run_log.omitted += report['omitted']
+        for kind in counts:
+            counts[kind] += report['counts'].get(kind, 0)
+        bot.metrics.merge(report['metrics'])
+    bot.run_log.counts = counts
+    logging.info(f"Merged {len(paths)} shard reports: {bot.processed_count} pages, "
+                 f"{counts['edit']} edits, {counts['error']} errors")
+
+    try:
+        if await bot.login():
+            await bot.update_wiki_log()
+    finally:
+        bot.metrics.write(bot.metrics_path)
+        bot.run_log.close()
+        await bot.close_session()
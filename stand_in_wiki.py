@@ -0,0 +1,313 @@
+import asyncio
+import logging
+import random
+import re
+
+from aiohttp import web
+
+CATEGORY = "שגיאות פרמטריות בתבנית אתר רשמי"
+DATE_TEMPLATE = "תאריך משולב"
+FILLER = ("ערך זה עוסק באישיות ידועה מתולדות עם ישראל, שפעלה בקהילות רבות ברחבי העולם. "
+          "לאורך חייה כתבה ספרים ומאמרים, לימדה תלמידים רבים והשפיעה על דורות שלאחריה. ")
+# Invocations the bots fill, with the properties that feed them
+TEMPLATES = [
+    ("{{אתר רשמי}}", ['P856']),
+    ("{{אנצ יהודית}}", ['P8590']),
+    ("{{דף שער בספרייה הלאומית}}", ['P3997']),
+    ("{{" + DATE_TEMPLATE + "}}", ['P569', 'P570']),
+]
+
+
+def snak(prop, datatype, value):
+    return [{'mainsnak': {'snaktype': 'value', 'property': prop, 'datatype': datatype,
+                          'datavalue': {'value': value}}, 'rank': 'normal'}]
+
+
+def build_corpus(pages, page_size=4000, seed=0):
+    """Synthetic Hebrew articles and their Wikidata items
+
+    Every article uses one to three of TEMPLATES; those with the official site
+    template are in CATEGORY, so the category and embeddedin listings overlap
+    the way they do on the real wiki. A quarter of the articles are put in
+    CATEGORY by hand and use none of them, and a third of the date template
+    calls are already filled in. Returns (articles, entities).
+    """
+    rng = random.Random(seed)
+    articles, entities = {}, {}
+    for number in range(1, pages + 1):
+        title = f"ערך לדוגמה {number}"
+        qid = f"Q{1000 + number}"
+        used = rng.sample(TEMPLATES, rng.randint(1, 3))
+        tagged = rng.random() < 0.25
+        if tagged:
+            used = []
+        body = FILLER * max(1, page_size // len(FILLER))
+        calls = [invocation for invocation, _ in used]
+        if TEMPLATES[3] in used and rng.random() < 1 / 3:
+            calls[used.index(TEMPLATES[3])] = "{{" + DATE_TEMPLATE + "|תאריך לידה=1 בינואר 1800|תאריך פטירה=1870}}"
+        text = body + "\n\n== קישורים חיצוניים ==\n" + "\n".join(f"* {call}" for call in calls)
+        articles[title] = {
+            'pageid': number,
+            'revid': number * 10,
+            'timestamp': '2024-01-01T00:00:00Z',
+            'content': text,
+            'qid': qid,
+            'categories': [CATEGORY] if tagged or TEMPLATES[0] in used else [],
+            'templates': [invocation[2:-2] for invocation, _ in used]
+        }
+        year = rng.randint(1700, 1950)
+        claims = {
+            'P856': snak('P856', 'url', f"https://example.org/{number}"),
+            'P8590': snak('P8590', 'external-id', f"person-{number}"),
+            'P3997': snak('P3997', 'external-id', str(990000000 + number)),
+            'P569': snak('P569', 'time', {'time': f"+{year}-03-04T00:00:00Z", 'precision': 11,
+                                          'timezone': 0, 'before': 0, 'after': 0,
+                                          'calendarmodel': 'http://www.wikidata.org/entity/Q1985727'}),
+            'P570': snak('P570', 'time', {'time': f"+{year + 70}-00-00T00:00:00Z", 'precision': 9,
+                                          'timezone': 0, 'before': 0, 'after': 0,
+                                          'calendarmodel': 'http://www.wikidata.org/entity/Q1985727'}),
+            # Unused properties, so projections have something to drop
+            'P31': snak('P31', 'wikibase-item', {'entity-type': 'item', 'id': 'Q5'}),
+            'P21': snak('P21', 'wikibase-item', {'entity-type': 'item', 'id': 'Q6581097'}),
+        }
+        entities[qid] = {
+            'type': 'item',
+            'id': qid,
+            'lastrevid': 2000000 + number,
+            'labels': {'he': {'language': 'he', 'value': title}},
+            'sitelinks': {'hewiki': {'site': 'hewiki', 'title': title}},
+            'claims': claims
+        }
+    return articles, entities
+
+
+class StandInWiki:
+    """Local aiohttp stand-in for the MediaWiki and Wikidata APIs the bots call
+
+    One /w/api.php serves the wiki, hewiki and Wikidata alike. Every request
+    waits `latency` seconds (with jitter) and fails with a 503 carrying a short
+    Retry-After with probability `error_rate`. Counts of requests per action
+    and bytes sent are kept for the benchmark and served on /stats.
+    """
+
+    def __init__(self, articles, entities, latency=0.0, error_rate=0.0, seed=0):
+        self.corpus = articles
+        self.entities = entities
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        # Empty it to stand in for a wiki on the default search backend
+        self.extensions = ['CirrusSearch']
+        self.reset()
+
+    def reset(self):
+        # Edits only touch this copy, so every run starts from the same corpus
+        self.articles = {title: dict(article) for title, article in self.corpus.items()}
+        # Pages outside the corpus that the bots write, such as the run log
+        self.other_pages = {}
+        self.stats = {'requests': 0, 'errors': 0, 'edits': 0, 'bytes_out': 0, 'actions': {}}
+
+    def app(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_route('*', '/w/api.php', self.api)
+        app.router.add_get('/stats', self.get_stats)
+        app.router.add_post('/reset', self.post_reset)
+        return app
+
+    async def get_stats(self, request):
+        return web.json_response(self.stats)
+
+    async def post_reset(self, request):
+        self.reset()
+        return web.json_response({})
+
+    def count(self, name):
+        self.stats['actions'][name] = self.stats['actions'].get(name, 0) + 1
+
+    async def api(self, request):
+        params = dict(request.query)
+        if request.method == 'POST':
+            params.update(await request.post())
+        self.stats['requests'] += 1
+
+        if self.latency:
+            await asyncio.sleep(self.latency * self.rng.uniform(0.5, 1.5))
+        if self.rng.random() < self.error_rate:
+            self.stats['errors'] += 1
+            return web.Response(status=503, headers={'Retry-After': '0.1'})
+
+        action = params.get('action')
+        if action == 'query':
+            result = self.query(params)
+        elif action == 'login':
+            self.count('login')
+            result = {'login': {'result': 'Success'}}
+        elif action == 'edit':
+            result = self.edit(params)
+        elif action == 'wbgetentities':
+            result = self.wbgetentities(params)
+        else:
+            self.count(f'unknown:{action}')
+            result = {'error': {'code': 'badvalue', 'info': f"Unrecognized value for action: {action}"}}
+
+        response = web.json_response(result)
+        self.stats['bytes_out'] += len(response.body)
+        return response
+
+    def listing(self, module, title):
+        if module == 'categorymembers':
+            category = title.split(':', 1)[1]
+            return [name for name, article in self.articles.items() if category in article['categories']]
+        if module == 'embeddedin':
+            template = title.split(':', 1)[1]
+            return [name for name, article in self.articles.items() if template in article['templates']]
+        return []
+
+    def page_entry(self, title, with_content):
+        article = self.articles.get(title)
+        if not article and title in self.other_pages:
+            page = {'pageid': -1 - len(self.corpus), 'ns': 2, 'title': title}
+            if with_content:
+                page['revisions'] = [{'revid': 1, 'timestamp': '2024-01-01T00:00:00Z', '*': self.other_pages[title]}]
+            return page
+        if not article:
+            return {'ns': 0, 'title': title, 'missing': ''}
+        page = {'pageid': article['pageid'], 'ns': 0, 'title': title}
+        if with_content:
+            page['revisions'] = [{'revid': article['revid'], 'parentid': article['revid'] - 1,
+                                  'timestamp': article['timestamp'], '*': article['content']}]
+        return page
+
+    def query(self, params):
+        if params.get('meta') == 'tokens':
+            self.count('query:tokens')
+            token_type = params.get('type', 'csrf')
+            return {'query': {'tokens': {f'{token_type}token': 'stand-in-token+\\'}}}
+
+        if params.get('meta') == 'siteinfo':
+            self.count('query:siteinfo')
+            return {'batchcomplete': '', 'query': {'extensions': [{'type': 'other', 'name': name}
+                                                                  for name in self.extensions]}}
+
+        prefixes = {'categorymembers': 'cm', 'embeddedin': 'ei'}
+        module = params.get('generator') or params.get('list')
+        if module in prefixes:
+            generator = 'generator' in params
+            prefix = ('g' if generator else '') + prefixes[module]
+            self.count(f"query:{'generator' if generator else 'list'}:{module}")
+            names = self.listing(module, params.get(f'{prefix}title', ''))
+            offset = int(params.get(f'{prefix}continue', 0))
+            limit = int(params.get(f'{prefix}limit', 10))
+            chunk = names[offset:offset + limit]
+            result = {'batchcomplete': ''}
+            if offset + limit < len(names):
+                result['continue'] = {f'{prefix}continue': str(offset + limit), 'continue': 'gcontinue||' if generator else '-||'}
+            if generator:
+                result['query'] = {'pages': {str(self.articles[name]['pageid']): self.page_entry(name, True)
+                                             for name in chunk}}
+            else:
+                result['query'] = {module: [{'pageid': self.articles[name]['pageid'], 'ns': 0, 'title': name}
+                                            for name in chunk]}
+            return result
+
+        if params.get('list') == 'search':
+            # Enough of CirrusSearch for the bots' hastemplate + insource:/regex/ queries
+            self.count('query:search')
+            query = params.get('srsearch', '')
+            template = re.search(r'hastemplate:"([^"]+)"', query)
+            pattern = re.search(r'insource:/(.*)/', query)
+            names = [name for name, article in self.articles.items()
+                     if (not template or template.group(1) in article['templates'])
+                     and (not pattern or re.search(pattern.group(1), article['content']))]
+            offset = int(params.get('sroffset', 0))
+            limit = int(params.get('srlimit', 10))
+            result = {'batchcomplete': '', 'query': {'search': [{'ns': 0, 'title': name}
+                                                               for name in names[offset:offset + limit]]}}
+            if offset + limit < len(names):
+                result['continue'] = {'sroffset': offset + limit, 'continue': '-||'}
+            return result
+
+        if params.get('list') == 'recentchanges':
+            self.count('query:recentchanges')
+            return {'batchcomplete': '', 'query': {'recentchanges': []}}
+
+        titles = [title for title in params.get('titles', '').split('|') if title]
+        if params.get('prop') == 'pageprops':
+            self.count('query:pageprops')
+            pages = {}
+            for number, title in enumerate(titles):
+                page = self.page_entry(title, False)
+                if title in self.articles:
+                    page['pageprops'] = {'wikibase_item': self.articles[title]['qid']}
+                pages[str(page.get('pageid', -1 - number))] = page
+            return {'batchcomplete': '', 'query': {'pages': pages}}
+
+        if params.get('prop') == 'templates':
+            self.count('query:templates')
+            wanted = {title.split(':', 1)[1] for title in params.get('tltemplates', '').split('|') if ':' in title}
+            pages = {}
+            for number, title in enumerate(titles):
+                page = self.page_entry(title, False)
+                used = [name for name in self.articles.get(title, {}).get('templates', []) if name in wanted]
+                if used:
+                    page['templates'] = [{'ns': 10, 'title': f"תבנית:{name}"} for name in used]
+                pages[str(page.get('pageid', -1 - number))] = page
+            return {'batchcomplete': '', 'query': {'pages': pages}}
+
+        if params.get('prop') == 'info':
+            self.count('query:info')
+            pages = {}
+            for number, title in enumerate(titles):
+                page = self.page_entry(title, False)
+                content = self.articles[title]['content'] if title in self.articles else self.other_pages.get(title)
+                if content is not None:
+                    page['length'] = len(content.encode('utf-8'))
+                pages[str(page.get('pageid', -1 - number))] = page
+            return {'batchcomplete': '', 'query': {'pages': pages}}
+
+        if params.get('prop') == 'revisions':
+            self.count('query:revisions')
+            pages = {}
+            for number, title in enumerate(titles):
+                page = self.page_entry(title, True)
+                pages[str(page.get('pageid', -1 - number))] = page
+            return {'batchcomplete': '', 'query': {'pages': pages}}
+
+        self.count('query:other')
+        return {'batchcomplete': '', 'query': {}}
+
+    def edit(self, params):
+        self.count('edit')
+        self.stats['edits'] += 1
+        title = params.get('title')
+        article = self.articles.get(title)
+        if article:
+            article['revid'] += 1
+            article['content'] = params.get('text', '')
+        elif 'appendtext' in params:
+            self.other_pages[title] = self.other_pages.get(title, '') + params['appendtext']
+        else:
+            self.other_pages[title] = params.get('text', '')
+        return {'edit': {'result': 'Success', 'title': title,
+                         'newrevid': article['revid'] if article else 1}}
+
+    def wbgetentities(self, params):
+        self.count(f"wbgetentities:{params.get('props', 'all')}")
+        props = params.get('props', 'info|claims').split('|')
+        entities = {}
+        for qid in params.get('ids', '').split('|'):
+            entity = self.entities.get(qid)
+            if not entity:
+                entities[qid] = {'id': qid, 'missing': ''}
+                continue
+            entities[qid] = {key: value for key, value in entity.items()
+                             if key in ('type', 'id', 'lastrevid') or key in props}
+        return {'entities': entities, 'success': 1}
+
+
+def serve(port, pages, page_size=4000, latency=0.0, error_rate=0.0, seed=0):
+    """Run a stand-in wiki on localhost:port until the process is stopped"""
+    logging.basicConfig(level=logging.WARNING)
+    articles, entities = build_corpus(pages, page_size, seed)
+    wiki = StandInWiki(articles, entities, latency, error_rate, seed)
+    web.run_app(wiki.app(), host='127.0.0.1', port=port, print=None, access_log=None)
@@ -0,0 +1,79 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+
+from wikidata_cache import CACHE_PATH
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "title_rules.json")
+RESOLVED_TTL = 30 * 24 * 3600
+UNRESOLVED_TTL = 24 * 3600
+
+
+class TitleResolver:
+    """Memoized wiki title -> hewiki title -> QID resolution shared by both bots
+
+    Titles are first rewritten by the regex rules in title_rules.json, then
+    looked up on hewiki. Unresolved titles are remembered too, for a shorter
+    time, so pages without an item do not cost a request on every run.
+    """
+
+    def __init__(self, path=CACHE_PATH, rules_path=RULES_PATH,
+                 resolved_ttl=RESOLVED_TTL, unresolved_ttl=UNRESOLVED_TTL):
+        self.path = path
+        self.resolved_ttl = resolved_ttl
+        self.unresolved_ttl = unresolved_ttl
+        self.rules = self.load_rules(rules_path)
+        self.db = sqlite3.connect(path)
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS resolved_titles (
+                title TEXT PRIMARY KEY,
+                qid TEXT,
+                checked REAL NOT NULL
+            )
+        ''')
+
+    def load_rules(self, rules_path):
+        if not os.path.exists(rules_path):
+            return []
+        try:
+            with open(rules_path, encoding='utf-8') as f:
+                return [(re.compile(rule['pattern']), rule['replace']) for rule in json.load(f)]
+        except (ValueError, KeyError, re.error) as e:
+            logging.error(f"Error loading title rules from {rules_path}: {str(e)}")
+            return []
+
+    def close(self):
+        if self.db:
+            self.db.commit()
+            self.db.close()
+            self.db = None
+
+    def apply_rules(self, title):
+        for pattern, replace in self.rules:
+            title = pattern.sub(replace, title)
+        return title
+
+    def lookup(self, titles):
+        """Return (known, unknown): known maps title -> QID or None for a cached miss"""
+        now = time.time()
+        known, unknown = {}, []
+        for title in titles:
+            row = self.db.execute('SELECT qid, checked FROM resolved_titles WHERE title = ?',
+                                  (title,)).fetchone()
+            if row and now - row[1] < (self.resolved_ttl if row[0] else self.unresolved_ttl):
+                known[title] = row[0]
+            else:
+                unknown.append(title)
+        return known, unknown
+
+    def store(self, resolved):
+        now = time.time()
+        try:
+            self.db.executemany('INSERT OR REPLACE INTO resolved_titles VALUES (?, ?, ?)',
+                                [(title, qid, now) for title, qid in resolved.items()])
+            self.db.commit()
+        except sqlite3.Error as e:
+            logging.error(f"Error writing title resolver cache: {str(e)}")
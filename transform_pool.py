@@ -0,0 +1,65 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from api_decode import Entity
+
+LARGE_PAGE_CHARS = 50_000
+
+_transformer = None
+
+
+def _warm_up(templates, value_handlers):
+    """Build the template registry once in each worker process"""
+    global _transformer
+    from WikidataImportBot import WikidataBot
+    transformer = WikidataBot.__new__(WikidataBot)
+    transformer.templates = templates
+    transformer.value_handlers = value_handlers
+    transformer.templates_regex = transformer.compile_templates()
+    _transformer = transformer
+
+
+def _transform(title, content, claims):
+    changes = []
+    new_text = _transformer.process_page(title, content, Entity(None, claims=claims) if claims else None, changes)
+    return new_text, changes
+
+
+class TransformPool:
+    """Process pool that rewrites pages too large to transform on the event loop
+
+    Workers are spawned on first use and build the bot's template registry
+    once; each page then ships only its text and the item's projected claims.
+    Workers run WikidataBot's transform methods on the bot's templates, so
+    subclasses customize transforms through the registry, not by overriding.
+    """
+
+    def __init__(self, bot, processes=None, threshold=LARGE_PAGE_CHARS):
+        self.bot = bot
+        self.processes = (os.cpu_count() or 1) if processes is None else processes
+        self.threshold = threshold
+        self.executor = None
+
+    def wants(self, content):
+        return self.processes > 0 and len(content) >= self.threshold
+
+    async def process_page(self, title, content, entity_data, changes):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                self.processes,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_warm_up,
+                initargs=(self.bot.templates, self.bot.value_handlers)
+            )
+        claims = entity_data.claims if entity_data else None
+        new_text, page_changes = await asyncio.get_running_loop().run_in_executor(
+            self.executor, _transform, title, content, claims)
+        changes.extend(page_changes)
+        return new_text
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+
+PUBLISH_INTERVAL = 15 * 60
+CHECK_INTERVAL = 5
+MAX_PAGE_BYTES = 200 * 1024
+
+
+class WikiLogPublisher:
+    """Background task that appends new run log entries to the on-wiki log page
+
+    Entries are published when `volume` of them are waiting or `interval`
+    seconds have passed, whichever comes first. Only what is new is sent,
+    as an appendtext edit with a dated heading. Once the page would grow
+    past max_bytes its text moves to a dated archive subpage and the page
+    starts over. The page pipeline never waits on any of this.
+    """
+
+    def __init__(self, bot, page, volume, interval=PUBLISH_INTERVAL, max_bytes=MAX_PAGE_BYTES):
+        self.bot = bot
+        self.page = page
+        self.volume = volume
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.size = None
+        self.lock = asyncio.Lock()
+        self.stopped = None
+        self.task = None
+
+    def start(self):
+        self.stopped = asyncio.Event()
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Stop the background task and publish whatever is still waiting"""
+        if self.task:
+            self.stopped.set()
+            await self.task
+            self.task = None
+            await self.publish()
+
+    async def run(self):
+        last = time.monotonic()
+        while not self.stopped.is_set():
+            try:
+                await asyncio.wait_for(self.stopped.wait(), CHECK_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            if self.stopped.is_set():
+                break
+            if len(self.bot.run_log.unpublished) >= self.volume or time.monotonic() - last >= self.interval:
+                await self.publish()
+                last = time.monotonic()
+
+    def render(self, entries, omitted):
+        run_log = self.bot.run_log
+        edits = [message for kind, message in entries if kind == 'edit']
+        errors = [message for kind, message in entries if kind == 'error']
+        timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M')
+        text = (f"\n== {timestamp} ==\n"
+                f"{self.bot.processed_count} דפים בריצה, {run_log.counts['edit']} עריכות, "
+                f"{run_log.counts['error']} שגיאות\n")
+        if omitted:
+            text += f"\n({omitted} רשומות ישנות הושמטו)\n"
+        if edits:
+            text += "=== עריכות ===\n" + "".join(f"* {message}\n" for message in edits)
+        if errors:
+            text += "=== שגיאות ===\n" + "".join(f"* {message}\n" for message in errors)
+        return text
+
+    async def page_size(self):
+        response = await self.bot.wiki_request('get', {'action': 'query', 'prop': 'info', 'titles': self.page})
+        if not response or 'query' not in response:
+            return None
+        page = next(iter(response['query'].get('pages', {}).values()), {})
+        return page.get('length', 0)
+
+    async def appended(self, text):
+        """Whether an append that got no answer reached the page anyway, going by the page length"""
+        if self.size is None:
+            return False
+        size = await self.page_size()
+        return size is not None and size >= self.size + len(text.encode('utf-8'))
+
+    async def roll_over(self):
+        pages = await self.bot.get_pages_content([self.page])
+        if not pages:
+            return False
+        archive = f"{self.page}/ארכיון {datetime.now(timezone.utc).strftime('%Y-%m-%d %H%M%S')}"
+        if not await self.bot.save_page(archive, pages[0].content, "העברת לוג לארכיון"):
+            return False
+        header = f"לוג ריצות הבוט. רשומות קודמות: [[{archive}]]\n"
+        if not await self.bot.save_page(self.page, header, "התחלת לוג חדש אחרי העברה לארכיון"):
+            return False
+        self.size = len(header.encode('utf-8'))
+        logging.info(f"Archived the wiki log to {archive}")
+        return True
+
+    async def publish(self):
+        async with self.lock:
+            entries, omitted = self.bot.run_log.take_unpublished()
+            if not entries:
+                return
+            try:
+                text = self.render(entries, omitted)
+                if self.size is None:
+                    self.size = await self.page_size()
+                if self.size is not None and self.size + len(text.encode('utf-8')) > self.max_bytes:
+                    await self.roll_over()
+
+                summary = f"עדכון לוג אוטומטי - {len(entries)} רשומות חדשות"
+                if await self.bot.save_page(self.page, text, summary, append=True) or await self.appended(text):
+                    if self.size is not None:
+                        self.size += len(text.encode('utf-8'))
+                    logging.info(f"Published {len(entries)} log entries at {self.bot.processed_count} pages")
+                else:
+                    logging.error(f"Failed to publish {len(entries)} entries to {self.page}")
+                    self.bot.run_log.requeue(entries)
+            except Exception as e:
+                logging.error(f"Error updating wiki log: {str(e)}")
+                self.bot.run_log.requeue(entries)
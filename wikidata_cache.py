@@ -0,0 +1,93 @@
+import json
+import logging
+import sqlite3
+import time
+
+from api_decode import Entity, loads
+
+CACHE_PATH = "wikidata_cache.sqlite"
+ENTITY_TTL = 7 * 24 * 3600
+
+
+class EntityCache:
+    """On-disk cache of Wikidata entities (api_decode.Entity) keyed by QID and lastrevid"""
+
+    def __init__(self, path=CACHE_PATH, entity_ttl=ENTITY_TTL):
+        self.path = path
+        self.entity_ttl = entity_ttl
+        self.db = sqlite3.connect(path)
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS entities (
+                qid TEXT PRIMARY KEY,
+                lastrevid INTEGER,
+                data TEXT NOT NULL,
+                checked REAL NOT NULL
+            )
+        ''')
+
+    def close(self):
+        if self.db:
+            self.db.commit()
+            self.db.close()
+            self.db = None
+
+    def lookup(self, qids, properties=None):
+        """Split QIDs into fresh hits, stale entries to revalidate and misses
+
+        Returns (hits, stale, misses): hits maps QID -> entity, stale maps
+        QID -> cached lastrevid. Entities whose stored claim projection does
+        not cover properties count as misses.
+        """
+        now = time.time()
+        hits, stale, misses = {}, {}, []
+
+        for qid in qids:
+            row = self.db.execute('SELECT lastrevid, data, checked FROM entities WHERE qid = ?',
+                                  (qid,)).fetchone()
+            if row is None:
+                misses.append(qid)
+                continue
+
+            lastrevid, data, checked = row
+            if now - checked < self.entity_ttl:
+                entity = Entity.from_dict(loads(data))
+                if properties and not entity.covers(properties):
+                    misses.append(qid)
+                else:
+                    hits[qid] = entity
+            else:
+                stale[qid] = lastrevid
+
+        return hits, stale, misses
+
+    def get(self, qid):
+        row = self.db.execute('SELECT data FROM entities WHERE qid = ?', (qid,)).fetchone()
+        return Entity.from_dict(loads(row[0])) if row else None
+
+    def store(self, entities):
+        """Store a QID -> entity mapping"""
+        now = time.time()
+        try:
+            self.db.executemany('INSERT OR REPLACE INTO entities VALUES (?, ?, ?, ?)', [
+                (qid, entity.lastrevid, json.dumps(entity.to_dict(), ensure_ascii=False), now)
+                for qid, entity in entities.items()])
+            self.db.commit()
+        except sqlite3.Error as e:
+            logging.error(f"Error writing Wikidata cache: {str(e)}")
+
+    def touch(self, qids):
+        """Mark cached entities as revalidated without rewriting them"""
+        now = time.time()
+        try:
+            self.db.executemany('UPDATE entities SET checked = ? WHERE qid = ?', [(now, qid) for qid in qids])
+            self.db.commit()
+        except sqlite3.Error as e:
+            logging.error(f"Error writing Wikidata cache: {str(e)}")
+
+    def invalidate(self, qids):
+        """Force a lastrevid check for these entities on their next lookup"""
+        try:
+            self.db.executemany('UPDATE entities SET checked = 0 WHERE qid = ?', [(qid,) for qid in qids])
+            self.db.commit()
+        except sqlite3.Error as e:
+            logging.error(f"Error writing Wikidata cache: {str(e)}")
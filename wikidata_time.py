@@ -0,0 +1,53 @@
+import logging
+import re
+from functools import lru_cache
+
+GREGORIAN = 'http://www.wikidata.org/entity/Q1985727'
+JULIAN = 'http://www.wikidata.org/entity/Q1985786'
+MONTHS = ("ינואר", "פברואר", "מרץ", "אפריל", "מאי", "יוני",
+          "יולי", "אוגוסט", "ספטמבר", "אוקטובר", "נובמבר", "דצמבר")
+BCE = ' לפנה"ס'
+DAY, MONTH, YEAR = 11, 10, 9
+CACHE_SIZE = 4096
+
+TIME_PATTERN = re.compile(r'^([+-])(\d+)-(\d\d)-(\d\d)T')
+
+
+def format_time(value):
+    """Hebrew text for a Wikidata time value, or None if it cannot be shown
+
+    Follows the value's precision down to the year, the coarsest form the
+    date templates read as a date; a 00 month or day lowers the precision to
+    match. Years before the common era get a suffix. Julian calendar dates
+    are written as recorded, with no note in the value. Results are
+    memoized per (time, precision, calendar).
+    """
+    if not isinstance(value, dict) or 'time' not in value:
+        return None
+    return render_time(value['time'], value.get('precision', DAY), value.get('calendarmodel', GREGORIAN))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def render_time(time, precision, calendar):
+    match = TIME_PATTERN.match(time)
+    if not match:
+        logging.error(f"Unrecognized Wikidata time: {time}")
+        return None
+    if calendar not in (GREGORIAN, JULIAN):
+        logging.error(f"Unsupported calendar model {calendar} for {time}")
+        return None
+
+    sign, year, month, day = match.group(1), int(match.group(2)), int(match.group(3)), int(match.group(4))
+    if precision >= DAY and not day:
+        precision = MONTH
+    if precision >= MONTH and not month:
+        precision = YEAR
+    if precision < YEAR or (precision >= MONTH and month > 12):
+        return None
+
+    era = BCE if sign == '-' else ''
+    if precision >= DAY:
+        return f"{day} ב{MONTHS[month - 1]} {year}{era}"
+    if precision == MONTH:
+        return f"{MONTHS[month - 1]} {year}{era}"
+    return f"{year}{era}"
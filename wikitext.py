@@ -0,0 +1,153 @@
+import re
+
+TOKENS = re.compile(r'<!--|<nowiki>|\{\{|\}\}|\[\[|\]\]|\||=')
+CLOSERS = {'<!--': '-->', '<nowiki>': '</nowiki>'}
+NAMESPACE_PREFIXES = ('תבנית:', 'Template:')
+
+
+def normalize_name(name):
+    name = ' '.join(name.replace('_', ' ').split())
+    for prefix in NAMESPACE_PREFIXES:
+        if name.startswith(prefix):
+            return name[len(prefix):].strip()
+    return name
+
+
+class Argument:
+    """One |-separated argument: its span, and the value span after any top-level ="""
+    __slots__ = ('start', 'end', 'name', 'value_start')
+
+    def __init__(self, start, end, name, value_start):
+        self.start = start
+        self.end = end
+        self.name = name
+        self.value_start = value_start
+
+
+class Invocation:
+    """A template call found by scan_templates, with spans into the scanned text
+
+    arguments maps names to Argument; positional arguments are named '1',
+    '2', ... as MediaWiki numbers them, and a repeated name keeps the last.
+    """
+    __slots__ = ('name', 'start', 'end', 'arguments', 'multiline')
+
+    def __init__(self, name, start, end, arguments, multiline):
+        self.name = name
+        self.start = start
+        self.end = end
+        self.arguments = arguments
+        self.multiline = multiline
+
+    def fill(self, text, values):
+        """Invocation text with values (name -> text) set where the argument is missing or blank
+
+        Blank arguments are filled in place so positions stay put; absent ones
+        are appended before the closing braces, one per line if the call
+        already is.
+        """
+        replaced = {}
+        appended = []
+        for name, value in values.items():
+            argument = self.arguments.get(name)
+            if argument is None:
+                appended.append(f"|{value}" if name == '1' else f"|{name}={value}")
+            elif not text[argument.value_start:argument.end].strip():
+                replaced[argument.value_start] = (argument.end, value)
+        if not replaced and not appended:
+            return None
+
+        parts = []
+        position = self.start
+        for value_start in sorted(replaced):
+            end, value = replaced[value_start]
+            blank = text[value_start:end]
+            # Keep a line break that ended the blank value
+            parts.append(text[position:value_start] + value + blank[len(blank.rstrip('\n')):])
+            position = end
+        body = ''.join(parts) + text[position:self.end - 2]
+        if appended:
+            content = body.rstrip()
+            separator = '\n' if self.multiline else ''
+            body = content + separator + separator.join(appended) + body[len(content):]
+        return body + '}}'
+
+
+class _Frame:
+    __slots__ = ('kind', 'start', 'pipes', 'equals')
+
+    def __init__(self, kind, start):
+        self.kind = kind
+        self.start = start
+        self.pipes = []
+        self.equals = {}
+
+
+def _invocation(text, frame, end):
+    body_end = end - 2
+    bounds = [frame.start + 2] + [pipe + 1 for pipe in frame.pipes]
+    ends = frame.pipes + [body_end]
+    name = normalize_name(_strip_comments(text[bounds[0]:ends[0]]))
+    if not name or name.startswith('#') or ':' in name:
+        return None  # Parser functions and magic words, not templates
+
+    arguments = {}
+    position = 0
+    for index in range(1, len(bounds)):
+        equals = frame.equals.get(index)
+        if equals is None:
+            position += 1
+            arguments[str(position)] = Argument(bounds[index], ends[index], str(position), bounds[index])
+        else:
+            key = _strip_comments(text[bounds[index]:equals]).strip()
+            arguments[key] = Argument(bounds[index], ends[index], key, equals + 1)
+    multiline = any(text[pipe - 1] == '\n' for pipe in frame.pipes if pipe > 0)
+    return Invocation(name, frame.start, end, arguments, multiline)
+
+
+def _strip_comments(text):
+    return re.sub(r'<!--.*?(-->|$)', '', text, flags=re.S)
+
+
+def scan_templates(text):
+    """Every template invocation in text, in order of their opening braces
+
+    One left-to-right pass over the braces, links, pipes and equals signs.
+    Nested calls are reported along with the call around them; comments and
+    nowiki sections are skipped, and pipes inside links do not split
+    arguments. Unclosed braces are ignored.
+    """
+    invocations = []
+    stack = []
+    position = 0
+    while True:
+        match = TOKENS.search(text, position)
+        if not match:
+            break
+        token = match.group()
+        position = match.end()
+        if token in CLOSERS:
+            close = text.find(CLOSERS[token], position)
+            position = len(text) if close < 0 else close + len(CLOSERS[token])
+        elif token == '{{':
+            stack.append(_Frame('template', match.start()))
+        elif token == '[[':
+            stack.append(_Frame('link', match.start()))
+        elif token == ']]':
+            if stack and stack[-1].kind == 'link':
+                stack.pop()
+        elif token == '}}':
+            while stack and stack[-1].kind == 'link':
+                stack.pop()
+            if stack:
+                invocation = _invocation(text, stack.pop(), position)
+                if invocation:
+                    invocations.append(invocation)
+        elif stack and stack[-1].kind == 'template':
+            frame = stack[-1]
+            if token == '|':
+                frame.pipes.append(match.start())
+            elif frame.pipes and len(frame.pipes) not in frame.equals:
+                frame.equals[len(frame.pipes)] = match.start()
+    invocations.sort(key=lambda invocation: invocation.start)
+    return invocations